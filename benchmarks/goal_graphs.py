@@ -0,0 +1,137 @@
+import random
+import string
+from datetime import datetime, timedelta
+
+from invisibleroads_scripts.macros import chunk_iterable
+from invisibleroads_scripts.models import (
+    Base, Goal, GoalLink, GoalState, Note, SchemaVersion, add_goal_closure)
+from invisibleroads_scripts.settings import ID_LENGTH
+
+
+ID_ALPHABET = string.digits + string.ascii_letters
+WORDS = (
+    'call write review plan draft ship fix test read send update clean '
+    'design measure refactor schedule meet email budget hire').split()
+START_DATETIME = datetime(2020, 1, 1)
+INSERT_CHUNK_SIZE = 10000
+DEFAULT_OPTIONS = {
+    'chain_length': 0,
+    'fan_out': 0,
+    'root_ratio': 0.01,
+    'shared_ratio': 0,
+    'schedule_ratio': 0.02,
+    'note_ratio': 0.05,
+    'note_count': 2,
+    'note_line_count': 3,
+    'done_ratio': 0.2,
+    'cancelled_ratio': 0.05,
+}
+OPTIONS_BY_SHAPE = {
+    'deep': {'chain_length': 32},
+    'wide': {'fan_out': 64},
+    'dag': {'shared_ratio': 0.2},
+    'schedules': {'schedule_ratio': 0.6},
+    'notes': {'note_ratio': 0.5, 'note_count': 10, 'note_line_count': 8},
+    'mixed': {
+        'root_ratio': 0.1, 'shared_ratio': 0.05, 'schedule_ratio': 0.1,
+        'note_ratio': 0.2, 'note_count': 3},
+}
+SHAPES = list(OPTIONS_BY_SHAPE)
+
+
+def add_goal_graph(database, goal_count, shape='mixed', seed=0):
+    rows_by_table = prepare_goal_graph(goal_count, shape, seed)
+    with database.get_bind().begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            if table is not SchemaVersion:
+                connection.execute(table.delete())
+        for table, rows in rows_by_table.items():
+            for chunk_rows in chunk_iterable(rows, INSERT_CHUNK_SIZE):
+                connection.execute(table.insert(), chunk_rows)
+        add_goal_closure(connection)
+    database.expunge_all()
+    return {table.name: len(rows) for table, rows in rows_by_table.items()}
+
+
+def prepare_goal_graph(goal_count, shape='mixed', seed=0):
+    options = dict(DEFAULT_OPTIONS, **OPTIONS_BY_SHAPE[shape])
+    random_generator = random.Random(seed)
+    used_ids = set()
+    goal_ids = [make_id(random_generator, used_ids) for _ in range(
+        goal_count)]
+    rows_by_table = {Goal.__table__: [], GoalLink: [], Note.__table__: []}
+    for index, goal_id in enumerate(goal_ids):
+        goal_datetime = START_DATETIME + timedelta(minutes=index)
+        rows_by_table[Goal.__table__].append(prepare_goal_row(
+            random_generator, options, goal_id, goal_datetime, index + 1))
+        for parent_index in choose_parent_indices(
+                random_generator, options, index):
+            rows_by_table[GoalLink].append({
+                'parent_id': goal_ids[parent_index], 'child_id': goal_id})
+        if random_generator.random() >= options['note_ratio']:
+            continue
+        for note_index in range(random_generator.randint(
+                1, options['note_count'])):
+            rows_by_table[Note.__table__].append({
+                'id': make_id(random_generator, used_ids),
+                'id_datetime': goal_datetime + timedelta(seconds=note_index),
+                'text': '\n'.join(make_text(random_generator) for _ in range(
+                    random_generator.randint(1, options['note_line_count']))),
+                'goal_id': goal_id})
+    return rows_by_table
+
+
+def prepare_goal_row(random_generator, options, goal_id, goal_datetime, order):
+    x = random_generator.random()
+    if x < options['done_ratio']:
+        state = GoalState.Done
+    elif x < options['done_ratio'] + options['cancelled_ratio']:
+        state = GoalState.Cancelled
+    else:
+        state = GoalState.Pending
+    if random_generator.random() < options['schedule_ratio']:
+        schedule_datetime = goal_datetime + timedelta(
+            days=random_generator.randint(-60, 60),
+            hours=random_generator.randint(0, 23))
+    else:
+        schedule_datetime = None
+    return {
+        'id': goal_id,
+        'id_datetime': goal_datetime,
+        'text': make_text(random_generator),
+        'state': state,
+        'schedule_datetime': schedule_datetime,
+        'order': order,
+    }
+
+
+def choose_parent_indices(random_generator, options, index):
+    if not index:
+        return []
+    chain_length, fan_out = options['chain_length'], options['fan_out']
+    if chain_length:
+        return [index - 1] if index % chain_length else []
+    if fan_out:
+        return [(index - 1) // fan_out]
+    if random_generator.random() < options['root_ratio']:
+        return []
+    parent_indices = [random_generator.randrange(index)]
+    if index > 1 and random_generator.random() < options['shared_ratio']:
+        parent_index = random_generator.randrange(index)
+        if parent_index not in parent_indices:
+            parent_indices.append(parent_index)
+    return parent_indices
+
+
+def make_id(random_generator, used_ids):
+    while True:
+        x = ''.join(random_generator.choice(ID_ALPHABET) for _ in range(
+            ID_LENGTH))
+        if x not in used_ids:
+            used_ids.add(x)
+            return x
+
+
+def make_text(random_generator):
+    return ' '.join(random_generator.choice(WORDS) for _ in range(
+        random_generator.randint(2, 8)))
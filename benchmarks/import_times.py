@@ -0,0 +1,56 @@
+import statistics
+import subprocess
+import sys
+from argparse import ArgumentParser
+
+
+MODULE_NAMES = [
+    'invisibleroads_scripts',
+    'invisibleroads_scripts.models',
+    'invisibleroads_scripts.routines',
+]
+HEAVY_MODULE_NAMES = ['asyncio', 'psycopg2', 'sqlalchemy']
+
+
+def run(repeat_count, target_milliseconds):
+    is_fast = True
+    for module_name in MODULE_NAMES:
+        microseconds_list = []
+        for index in range(repeat_count):
+            microseconds_by_name = measure(module_name)
+            microseconds_list.append(microseconds_by_name[module_name])
+        milliseconds = statistics.median(microseconds_list) / 1000
+        heavy_module_names = [
+            _ for _ in HEAVY_MODULE_NAMES if _ in microseconds_by_name]
+        print('%s %.1fms %s' % (
+            module_name, milliseconds, ' '.join(heavy_module_names)))
+        if module_name == MODULE_NAMES[0]:
+            is_fast = milliseconds <= target_milliseconds and not (
+                heavy_module_names)
+    return is_fast
+
+
+def measure(module_name):
+    process = subprocess.run([
+        sys.executable, '-X', 'importtime', '-c', 'import ' + module_name,
+    ], stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    microseconds_by_name = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative_text, name = line.split('|')
+        try:
+            microseconds = int(cumulative_text)
+        except ValueError:
+            continue
+        microseconds_by_name[name.strip()] = microseconds
+    return microseconds_by_name
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('--repeat_count', type=int, default=9)
+    argument_parser.add_argument(
+        '--target_milliseconds', type=float, default=150)
+    args = argument_parser.parse_args()
+    sys.exit(0 if run(args.repeat_count, args.target_milliseconds) else 1)
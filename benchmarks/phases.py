@@ -0,0 +1,118 @@
+import json
+import pytz
+import sys
+import time
+from argparse import ArgumentParser
+from invisibleroads_macros.disk import TemporaryStorage
+from os.path import dirname, join
+
+from invisibleroads_scripts.models import configure_database
+from invisibleroads_scripts.routines import (
+    backup_database, format_mission_text, format_summary, get_goals,
+    get_orphan_goals, get_scheduled_goals, parse_mission_text, save_goals)
+
+from .goal_graphs import SHAPES, add_goal_graph
+
+
+BASELINE_PATH = join(dirname(__file__), 'baseline.json')
+GOAL_COUNTS = [1000, 10000]
+ZONE = pytz.UTC
+
+
+def run(database_url, shapes, goal_counts, seed):
+    seconds_by_key = {}
+    with TemporaryStorage() as (storage):
+        for shape in shapes:
+            for goal_count in goal_counts:
+                name = f'{shape}-{goal_count}'
+                database = configure_database(database_url or (
+                    'sqlite:///' + join(storage.folder, name + '.sqlite')))
+                add_goal_graph(database, goal_count, shape, seed)
+                for phase_name, seconds in measure(
+                        database, join(storage.folder, name)).items():
+                    seconds_by_key[f'{name} {phase_name}'] = seconds
+                database.close()
+    return seconds_by_key
+
+
+def measure(database, target_folder):
+    seconds_by_phase_name = {}
+
+    def time_phase(phase_name, f, *args, **kw):
+        t = time.perf_counter()
+        x = f(*args, **kw)
+        seconds_by_phase_name[phase_name] = time.perf_counter() - t
+        return x
+
+    goals = time_phase('get_goals', get_goals, database)
+    scheduled_goals = time_phase(
+        'get_scheduled_goals', get_scheduled_goals, database)
+    text = time_phase(
+        'format_mission_text', format_mission_text, goals, ZONE,
+        scheduled_goals=scheduled_goals)
+    save_goals(database, time_phase(
+        'parse_mission_text', parse_mission_text, database, text, ZONE))
+    text = format_mission_text(
+        get_goals(database), ZONE,
+        scheduled_goals=get_scheduled_goals(database))
+    time_phase(
+        'parse_mission_edit', parse_mission_text, database,
+        text + '\n    benchmark goal', ZONE, original_text=text)
+    database.rollback()
+    time_phase('get_orphan_goals', get_orphan_goals, database)
+    time_phase('format_summary', format_summary, database, ZONE)
+    time_phase(
+        'backup_database', backup_database, target_folder, database, ZONE)
+    return seconds_by_phase_name
+
+
+def compare(seconds_by_key, baseline_seconds_by_key, tolerance):
+    slow_keys = []
+    for key, seconds in seconds_by_key.items():
+        baseline_seconds = baseline_seconds_by_key.get(key)
+        if baseline_seconds is None:
+            print('%-40s %8.3fs' % (key, seconds))
+            continue
+        ratio = seconds / baseline_seconds if baseline_seconds else 1
+        is_slow = seconds > baseline_seconds * (1 + tolerance) + 0.01
+        print('%-40s %8.3fs %8.3fs %5.2fx%s' % (
+            key, seconds, baseline_seconds, ratio, ' SLOW' if is_slow else ''))
+        if is_slow:
+            slow_keys.append(key)
+    return slow_keys
+
+
+def load_baseline(baseline_path):
+    try:
+        return json.load(open(baseline_path, 'rt'))
+    except (OSError, ValueError):
+        return {}
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('--database_url', metavar='URL')
+    argument_parser.add_argument(
+        '--shapes', nargs='+', choices=SHAPES, default=SHAPES)
+    argument_parser.add_argument(
+        '--goal_counts', nargs='+', type=int, default=GOAL_COUNTS)
+    argument_parser.add_argument('--seed', type=int, default=0)
+    argument_parser.add_argument(
+        '--baseline_path', metavar='PATH', default=BASELINE_PATH)
+    argument_parser.add_argument('--tolerance', type=float, default=0.5)
+    argument_parser.add_argument('--update_baseline', action='store_true')
+    args = argument_parser.parse_args()
+    seconds_by_key = run(
+        args.database_url, args.shapes, args.goal_counts, args.seed)
+    baseline_seconds_by_key = load_baseline(args.baseline_path)
+    slow_keys = compare(
+        seconds_by_key, baseline_seconds_by_key, args.tolerance)
+    if args.update_baseline:
+        baseline_seconds_by_key.update({
+            k: round(v, 4) for k, v in seconds_by_key.items()})
+        with open(args.baseline_path, 'wt') as (baseline_file):
+            json.dump(
+                baseline_seconds_by_key, baseline_file, indent=0,
+                sort_keys=True)
+    elif slow_keys:
+        sys.exit(1)
@@ -0,0 +1,78 @@
+import pytz
+import time
+from argparse import ArgumentParser
+from invisibleroads_macros.disk import TemporaryStorage
+from os.path import join
+from sqlalchemy import event
+
+from invisibleroads_scripts.models import (
+    Base, add_indexes, configure_database)
+from invisibleroads_scripts.routines import (
+    format_summary, get_goals, get_scheduled_goals)
+
+from .goal_graphs import SHAPES, add_goal_graph
+
+
+ZONE = pytz.UTC
+
+
+def run(goal_count, shape, seed):
+    with TemporaryStorage() as (storage):
+        database = configure_database('sqlite:///' + join(
+            storage.folder, 'goals.sqlite'))
+        add_goal_graph(database, goal_count, shape, seed)
+        drop_indexes(database)
+        print('# Without indexes')
+        measure(database)
+        with database.get_bind().begin() as connection:
+            add_indexes(connection)
+        print('# With indexes')
+        measure(database)
+
+
+def drop_indexes(database):
+    with database.get_bind().begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(connection, checkfirst=True)
+
+
+def measure(database):
+    engine = database.get_bind()
+    statements = []
+    parameters_by_statement = {}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+        parameters_by_statement.setdefault(statement, parameters)
+
+    for name, f in [
+        ('get_goals', lambda: get_goals(database)),
+        ('get_scheduled_goals', lambda: get_scheduled_goals(database)),
+        ('format_summary', lambda: format_summary(database, ZONE)),
+    ]:
+        event.listen(engine, 'before_cursor_execute', record)
+        t = time.time()
+        f()
+        seconds = time.time() - t
+        event.remove(engine, 'before_cursor_execute', record)
+        database.expunge_all()
+        print('%s %.3fs %s queries' % (name, seconds, len(statements)))
+        for statement in sorted(set(statements), key=statements.index):
+            print('  %sx %s' % (statements.count(statement), ' '.join(
+                statement.split())[:68]))
+            for row in database.connection().connection.execute(
+                    'EXPLAIN QUERY PLAN ' + statement,
+                    parameters_by_statement[statement]):
+                print('    ' + row[-1])
+        statements.clear()
+    database.close()
+
+
+if __name__ == '__main__':
+    argument_parser = ArgumentParser()
+    argument_parser.add_argument('--goal_count', type=int, default=5000)
+    argument_parser.add_argument('--shape', choices=SHAPES, default='mixed')
+    argument_parser.add_argument('--seed', type=int, default=0)
+    args = argument_parser.parse_args()
+    run(args.goal_count, args.shape, args.seed)
@@ -2,19 +2,16 @@ import time
 from configparser import ConfigParser
 from invisibleroads.scripts import Script
 
-from .macros import call_editor
-from .models import get_database_from_configuration
-from .routines import (
-    backup_database,
-    format_mission_text,
-    format_summary,
-    get_goals,
-    parse_mission_text)
 from .settings import (
     get_archive_folder,
+    get_archive_worker_count,
     get_editor_command,
     get_editor_timezone,
     get_folder_by_terms,
+    get_profile_log_path,
+    is_profile_enabled,
+    is_profile_memory_enabled,
+    is_sqlite_immutable,
     CONFIGURATION_PATH)
 
 
@@ -25,37 +22,96 @@ class EditMissionScript(Script):
             '--configuration_path', '-C', metavar='PATH',
             default=CONFIGURATION_PATH)
         argument_subparser.add_argument('--all', '-A', action='store_true')
+        argument_subparser.add_argument('--profile', action='store_true')
+        argument_subparser.add_argument(
+            '--profile_memory', action='store_true')
         argument_subparser.add_argument('terms', nargs='*')
 
     def run(self, args):
+        from .macros import call_editor
+        from .models import (
+            checkpoint_database,
+            get_async_engine_from_configuration,
+            get_database_from_configuration)
+        from .profiling import Profiler
+        from .routines import (
+            backup_databases,
+            format_summary,
+            get_goals,
+            get_scheduled_goals,
+            parse_mission_text,
+            prepare_mission_lines,
+            report_concurrently,
+            save_goals)
         c = ConfigParser()
         c.read(args.configuration_path)
         editor_command = get_editor_command(c)
         timezone = get_editor_timezone(c)
         database = get_database_from_configuration(c)
         archive_folder = get_archive_folder(c)
+        archive_worker_count = get_archive_worker_count(c)
         folder_by_terms = get_folder_by_terms(c)
-        goals = get_goals(database, args.terms)
+        immutable = is_sqlite_immutable(c)
+        with_memory = args.profile_memory or is_profile_memory_enabled(c)
+        profiler = Profiler(
+            is_enabled=args.profile or with_memory or is_profile_enabled(c),
+            with_memory=with_memory)
+        profiler.start()
+        with profiler.measure('get_goals'):
+            goals = get_goals(database, args.terms)
+            if args.terms or args.all or len(goals) == 1:
+                scheduled_goals = None
+            else:
+                scheduled_goals = get_scheduled_goals(database)
         # Edit
         while True:
-            text = format_mission_text(goals, timezone, show_archived=args.all)
+            with profiler.measure('render'):
+                lines = list(prepare_mission_lines(
+                    goals, timezone, show_archived=args.all,
+                    scheduled_goals=scheduled_goals))
 
-            database.close()
-            text = call_editor(editor_command, 'mission.md', text)
+            with profiler.measure('edit'):
+                text = call_editor(
+                    editor_command, 'mission.md', lines,
+                    before_call=database.close)
             database = get_database_from_configuration(c)
 
             try:
-                goals = parse_mission_text(database, text, timezone)
+                with profiler.measure('parse'):
+                    goals = parse_mission_text(
+                        database, text, timezone, original_text=lines)
             except ValueError:
                 print('Please specify a mission.')
                 time.sleep(3)
             break
         # Commit
-        for goal in goals:
-            database.merge(goal)
-            database.commit()
+        with profiler.measure('save'):
+            row_count = save_goals(database, goals)
+        if immutable and checkpoint_database(database):
+            database.close()
+            database = get_database_from_configuration(c, immutable=True)
         # Backup
-        backup_database(archive_folder, database, timezone)
-        for terms, folder in folder_by_terms.items():
-            backup_database(folder, database, timezone, terms)
-        print(format_summary(database, timezone))
+        folder_by_terms = {None: archive_folder, **folder_by_terms}
+        async_engine = get_async_engine_from_configuration(c)
+        if async_engine:
+            import asyncio
+            database.close()
+            with profiler.measure('backup and summary'):
+                summary = asyncio.run(report_concurrently(
+                    async_engine, folder_by_terms, timezone,
+                    incremental=True, worker_count=archive_worker_count))
+        else:
+            backup_databases(
+                folder_by_terms, database, timezone, incremental=True,
+                worker_count=archive_worker_count, profiler=profiler)
+            with profiler.measure('summary'):
+                summary = format_summary(database, timezone)
+        profiler.stop()
+        print('%s saved' % row_count)
+        print(summary)
+        if not profiler.is_enabled:
+            return
+        print(profiler.format_table())
+        log_path = get_profile_log_path(c)
+        if log_path:
+            profiler.save(log_path, terms=args.terms)
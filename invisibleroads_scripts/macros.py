@@ -2,22 +2,31 @@ import pytz
 from datetime import datetime
 from invisibleroads_macros.disk import TemporaryStorage
 from invisibleroads_macros.iterable import OrderedDefaultDict
-from os.path import join
+from invisibleroads_macros.security import make_random_string
+from filecmp import cmp
+from os import remove, replace
+from os.path import basename, dirname, exists, join
 from subprocess import call
 
+from .settings import ID_LENGTH
+
 
 DATESTAMP_FORMAT = '%Y%m%d'
 TIMESTAMP_FORMAT = DATESTAMP_FORMAT + '-%H%M'
 TIMESTAMP_FORMATS = (DATESTAMP_FORMAT, TIMESTAMP_FORMAT)
 UTC_TIMEZONE = pytz.UTC
+UTC_OFFSET_BY_KEY = {}
 
 
-def call_editor(editor_command, file_name, file_text):
+def call_editor(editor_command, file_name, file_text, before_call=None):
+    file_lines = [file_text] if isinstance(file_text, str) else file_text
     with TemporaryStorage() as (storage):
         text_path = join(storage.folder, file_name)
         with open(text_path, 'wt') as (text_file):
-            text_file.write(file_text)
+            stream_lines(text_file, file_lines)
             text_file.flush()
+            if before_call:
+                before_call()
             call(editor_command.split() + [text_path])
         with open(text_path, 'rt') as (text_file):
             file_text = text_file.read()
@@ -25,28 +34,120 @@ def call_editor(editor_command, file_name, file_text):
 
 
 def zone_datetime(x, source_timezone, target_timezone):
-    return (x.replace(tzinfo=source_timezone)).astimezone(target_timezone)
+    return localize_datetime(x, source_timezone).astimezone(target_timezone)
+
+
+def localize_datetime(x, zone):
+    x = x.replace(tzinfo=None)
+    try:
+        return zone.localize(x)
+    except AttributeError:
+        return x.replace(tzinfo=zone)
+
+
+def get_utc_offset(x, zone, is_local=False):
+    key = zone, is_local, x.year, x.month, x.day, x.hour
+    try:
+        return UTC_OFFSET_BY_KEY[key]
+    except KeyError:
+        pass
+    if is_local:
+        offset = localize_datetime(x, zone).utcoffset()
+    else:
+        offset = localize_datetime(x, UTC_TIMEZONE).astimezone(
+            zone).utcoffset()
+    UTC_OFFSET_BY_KEY[key] = offset
+    return offset
+
+
+def get_local_datetime(utc_datetime, zone):
+    utc_datetime = utc_datetime.replace(tzinfo=None)
+    return utc_datetime + get_utc_offset(utc_datetime, zone)
+
+
+def get_utc_datetime(local_datetime, zone):
+    offset = get_utc_offset(local_datetime, zone, is_local=True)
+    return (local_datetime - offset).replace(tzinfo=UTC_TIMEZONE)
 
 
 def format_timestamp(x, target_timezone, timestamp_format=TIMESTAMP_FORMAT):
-    return zone_datetime(x, UTC_TIMEZONE, target_timezone).strftime(
-        timestamp_format)
+    x = get_local_datetime(x, target_timezone)
+    if timestamp_format == TIMESTAMP_FORMAT:
+        return '%04d%02d%02d-%02d%02d' % (
+            x.year, x.month, x.day, x.hour, x.minute)
+    if timestamp_format == DATESTAMP_FORMAT:
+        return '%04d%02d%02d' % (x.year, x.month, x.day)
+    return x.strftime(timestamp_format)
 
 
 def parse_timestamp(
         text, source_timezone, timestamp_formats=TIMESTAMP_FORMATS):
     text = text.strip()
-    for timestamp_format in timestamp_formats:
-        try:
-            x = datetime.strptime(text, timestamp_format)
-        except ValueError:
-            continue
-
-        break
+    if timestamp_formats == TIMESTAMP_FORMATS:
+        x = parse_local_timestamp(text)
     else:
+        for timestamp_format in timestamp_formats:
+            try:
+                x = datetime.strptime(text, timestamp_format)
+            except ValueError:
+                continue
+
+            break
+        else:
+            raise ValueError
+    return get_utc_datetime(x, source_timezone)
+
+
+def parse_datestamp(text):
+    if len(text) != 8 or not text.isdigit():
         raise ValueError
+    return datetime(int(text[:4]), int(text[4:6]), int(text[6:]))
+
+
+def parse_local_timestamp(text):
+    if len(text) == 13 and text[8] == '-' and text[9:].isdigit():
+        return parse_datestamp(text[:8]).replace(
+            hour=int(text[9:11]), minute=int(text[11:]))
+    return parse_datestamp(text)
+
+
+def write_text(target_path, text):
+    try:
+        with open(target_path, 'rt') as (target_file):
+            if target_file.read() == text:
+                return False
+    except OSError:
+        pass
+    temporary_path = get_temporary_path(target_path)
+    with open(temporary_path, 'wt') as (temporary_file):
+        temporary_file.write(text)
+    replace(temporary_path, target_path)
+    return True
+
 
-    return zone_datetime(x, source_timezone, UTC_TIMEZONE)
+def write_lines(target_path, lines, separator='\n'):
+    temporary_path = get_temporary_path(target_path)
+    with open(temporary_path, 'wt') as (temporary_file):
+        stream_lines(temporary_file, lines, separator)
+    if exists(target_path) and cmp(
+            temporary_path, target_path, shallow=False):
+        remove(temporary_path)
+        return False
+    replace(temporary_path, target_path)
+    return True
+
+
+def stream_lines(target_file, lines, separator='\n'):
+    prefix = ''
+    for line in lines:
+        target_file.write(prefix)
+        target_file.write(line)
+        prefix = separator
+
+
+def get_temporary_path(target_path):
+    return join(dirname(target_path), '.%s.%s' % (
+        basename(target_path), make_random_string(ID_LENGTH)))
 
 
 def parse_text_by_key(text, key_prefix, parse_key):
@@ -61,6 +162,17 @@ def parse_text_by_key(text, key_prefix, parse_key):
     return {key: '\n'.join(lines) for key, lines in lines_by_key.items()}
 
 
+def chunk_iterable(iterable, chunk_size):
+    chunk = []
+    for x in iterable:
+        chunk.append(x)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def sort_by_attribute(items, attribute_name):
     packs = [(getattr(_, attribute_name), _) for _ in items]
     return [_[1] for _ in sorted(packs, key=lambda _: _[0])]
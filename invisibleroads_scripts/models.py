@@ -1,27 +1,53 @@
 import enum
 import re
+from collections import defaultdict, namedtuple
 from datetime import datetime
 from invisibleroads_macros.security import make_random_string
-from sqlalchemy import Column, ForeignKey, Table, create_engine
-from sqlalchemy.exc import IntegrityError
+from itertools import chain
+from sqlalchemy import (
+    Column, ForeignKey, Index, Table, create_engine, event, inspect, select,
+    text)
+from sqlalchemy.exc import DatabaseError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.orm import relationship, selectinload, sessionmaker
 from sqlalchemy.types import DateTime, Enum, Integer, String
 
 from .macros import (
-    format_timestamp, parse_timestamp, sort_by_attribute, zone_datetime,
-    UTC_TIMEZONE)
-from .settings import get_database_url, ID_LENGTH, INDENT
+    chunk_iterable, format_timestamp, parse_timestamp, sort_by_attribute,
+    zone_datetime, UTC_TIMEZONE)
+from .settings import (
+    get_async_database_url, get_database_url, get_sqlite_pragma_by_name,
+    ID_LENGTH, INDENT, SQLITE_PRAGMA_BY_NAME)
 
 
 SEPARATOR = '# '
 INDENT_PATTERN = re.compile('^\\s+')
 DATETIME = datetime.utcnow()
+DATABASE_SESSION_BY_URL = {}
+PREFETCH_CHUNK_SIZE = 500
+ID_BATCH_SIZE = 100
 Base = declarative_base()
+SectionToken = namedtuple('SectionToken', ['name'])
+GoalToken = namedtuple('GoalToken', [
+    'indent_depth', 'state', 'text', 'meta_text'])
+DateToken = namedtuple('DateToken', ['date'])
+NoteToken = namedtuple('NoteToken', ['datetime', 'id'])
+LineToken = namedtuple('LineToken', ['text'])
 GoalLink = Table(
     'goal_link', Base.metadata,
     Column('parent_id', String, ForeignKey('goal.id')),
-    Column('child_id', String, ForeignKey('goal.id')))
+    Column('child_id', String, ForeignKey('goal.id')),
+    Index('goal_link_parent_index', 'parent_id', 'child_id'),
+    Index('goal_link_child_index', 'child_id', 'parent_id'))
+GoalClosure = Table(
+    'goal_closure', Base.metadata,
+    Column('ancestor_id', String, ForeignKey('goal.id'), primary_key=True),
+    Column('descendant_id', String, ForeignKey('goal.id'), primary_key=True),
+    Column('depth', Integer),
+    Index('goal_closure_descendant_index', 'descendant_id'))
+SchemaVersion = Table(
+    'schema_version', Base.metadata,
+    Column('version', Integer))
 
 
 class GoalState(enum.IntEnum):
@@ -42,17 +68,7 @@ class IDMixin(object):
                 instance = Class(id=id)
             return instance
         else:
-            while True:
-                instance = Class(id=make_random_string(ID_LENGTH))
-                database.add(instance)
-                try:
-                    database.flush()
-                except IntegrityError:
-                    database.rollback()
-
-                break
-
-            return instance
+            return Class(id=make_ids(database, 1)[0])
 
     def __repr__(self):
         return '%s(id=%s)' % (self.__class__.__name__, self.id)
@@ -63,35 +79,109 @@ class TextMixin(object):
     text_datetime = Column(DateTime)
 
     def set_text(self, text):
+        text = text.rstrip()
         if not hasattr(self, 'old_text'):
             self.old_text = self.text
         if text in (self.old_text, self.text):
             return
         self.text_datetime = DATETIME
-        self.text = text.rstrip()
+        self.text = text
 
     def __repr__(self):
         return '%s(id=%s, text="%s")' % (
          self.__class__.__name__, self.id, self.text)
 
 
+class GoalRenderMixin(object):
+    __slots__ = ()
+
+    def render_text(self, zone, indent_depth=0):
+        return '%s%s%s  %s%s' % (
+         INDENT * indent_depth,
+         PREFIX_BY_STATE[self.state],
+         self.text,
+         SEPARATOR,
+         self._format_meta_text(zone))
+
+    def _format_meta_text(self, zone):
+        terms = []
+        if self.schedule_datetime:
+            terms.append(format_timestamp(self.schedule_datetime, zone))
+        if self.notes:
+            terms.append('...')
+        terms.append(self.id)
+        return ' '.join(terms)
+
+    @property
+    def sorted_notes(self):
+        return sort_by_attribute(self.notes, 'id_datetime')
+
+
+class NoteRenderMixin(object):
+    __slots__ = ()
+
+    def render_text(self, zone):
+        return '%s  %s%s\n%s' % (
+         format_timestamp(self.id_datetime, zone),
+         SEPARATOR,
+         self.id,
+         self.text)
+
+
 class GoalCache(object):
 
     def __init__(self, database):
         self.database = database
         self.goal_by_id = {}
+        self.note_by_id = {}
+        self.prefetched_ids = set()
+        self.free_ids = []
+
+    def prefetch(self, ids):
+        ids = sorted(set(ids) - self.prefetched_ids)
+        for index in range(0, len(ids), PREFETCH_CHUNK_SIZE):
+            chunk_ids = ids[index:index + PREFETCH_CHUNK_SIZE]
+            for goal in self.database.query(Goal).filter(
+                    Goal.id.in_(chunk_ids)).options(selectinload(
+                        Goal.parents)):
+                self.goal_by_id[goal.id] = goal
+            for note in self.database.query(Note).filter(
+                    Note.id.in_(chunk_ids)):
+                self.note_by_id[note.id] = note
+        self.prefetched_ids.update(ids)
 
     def get(self, id):
+        return self._get(Goal, self.goal_by_id, id)
+
+    def get_note(self, id):
+        return self._get(Note, self.note_by_id, id)
+
+    def make_id(self):
+        if not self.free_ids:
+            self.free_ids = make_ids(self.database, ID_BATCH_SIZE)
+        return self.free_ids.pop()
+
+    def _get(self, Class, instance_by_id, id):
+        if not id:
+            instance = Class(id=self.make_id())
+            instance_by_id[instance.id] = instance
+            return instance
         try:
-            return self.goal_by_id[id]
+            return instance_by_id[id]
         except KeyError:
-            goal = Goal.get(self.database, id)
-            self.goal_by_id[id] = goal
-            return goal
+            if id in self.prefetched_ids:
+                instance = Class(id=id)
+            else:
+                instance = Class.get(self.database, id)
+            instance_by_id[id] = instance
+            return instance
 
 
-class Goal(TextMixin, IDMixin, Base):
+class Goal(GoalRenderMixin, TextMixin, IDMixin, Base):
     __tablename__ = 'goal'
+    __table_args__ = (
+        Index('goal_state_order_index', 'state', 'order'),
+        Index('goal_state_schedule_index', 'state', 'schedule_datetime'))
     state = Column(Enum(GoalState), default=GoalState.Pending)
     state_datetime = Column(DateTime)
     schedule_datetime = Column(DateTime)
@@ -123,24 +213,39 @@ class Goal(TextMixin, IDMixin, Base):
             else:
                 new_local_datetime = date
             new_utc_datetime = zone_datetime(
-                new_local_datetime, zone, UTC_TIMEZONE)
+                new_local_datetime, zone, UTC_TIMEZONE).replace(tzinfo=None)
         else:
             new_utc_datetime = None
         self.schedule_datetime = new_utc_datetime
 
     @classmethod
     def parse_text(Class, goal_cache, text, zone):
+        return Class.parse_token(goal_cache, Class.tokenize_text(text), zone)
+
+    @classmethod
+    def tokenize_text(Class, text):
         goal_text, _, meta_text = text.partition(SEPARATOR)
-        goal_state = Class._parse_goal_state(goal_text)
-        schedule_datetime, goal_id = Class._parse_meta_text(meta_text, zone)
-        indent_depth = Class._parse_indent_depth(goal_text)
+        return GoalToken(
+            Class._parse_indent_depth(goal_text),
+            Class._parse_goal_state(goal_text),
+            goal_text.lstrip(' _+'),
+            meta_text)
+
+    @classmethod
+    def parse_token(Class, goal_cache, token, zone):
+        schedule_datetime, goal_id = Class._parse_meta_text(
+            token.meta_text, zone)
         goal = goal_cache.get(goal_id)
-        goal.set_text(goal_text.lstrip(' _+'))
-        goal.set_state(goal_state)
+        goal.set_text(token.text)
+        goal.set_state(token.state)
         goal.schedule_datetime = schedule_datetime
-        goal.indent_depth = indent_depth
+        goal.indent_depth = token.indent_depth
         return goal
 
+    @classmethod
+    def parse_token_id(Class, token, zone):
+        return Class._parse_meta_text(token.meta_text, zone)[1]
+
     @staticmethod
     def _parse_goal_state(text):
         text = text.lstrip()
@@ -166,59 +271,289 @@ class Goal(TextMixin, IDMixin, Base):
         while meta_terms:
             meta_term = meta_terms.pop()
             try:
-                schedule_datetime = parse_timestamp(meta_term, zone)
+                schedule_datetime = parse_timestamp(
+                    meta_term, zone).replace(tzinfo=None)
             except ValueError:
                 if len(meta_term) == ID_LENGTH:
                     goal_id = meta_term
         return schedule_datetime, goal_id
 
-    def render_text(self, zone, indent_depth=0):
-        return '%s%s%s  %s%s' % (
-         INDENT * indent_depth,
-         PREFIX_BY_STATE[self.state],
-         self.text,
-         SEPARATOR,
-         self._format_meta_text(zone))
 
-    def _format_meta_text(self, zone):
-        terms = []
-        if self.schedule_datetime:
-            terms.append(format_timestamp(self.schedule_datetime, zone))
-        if self.notes:
-            terms.append('...')
-        terms.append(self.id)
-        return ' '.join(terms)
+class Note(NoteRenderMixin, TextMixin, IDMixin, Base):
+    __tablename__ = 'note'
+    __table_args__ = (
+        Index('note_goal_index', 'goal_id'),)
+    goal_id = Column(String, ForeignKey('goal.id'))
 
-    @property
-    def sorted_notes(self):
-        return sort_by_attribute(self.notes, 'id_datetime')
 
+class GoalRecord(GoalRenderMixin):
+    __slots__ = (
+        'id', 'text', 'state', 'schedule_datetime', 'order', 'parents',
+        'children', 'notes')
 
-class Note(TextMixin, IDMixin, Base):
-    __tablename__ = 'note'
-    goal_id = Column(String, ForeignKey('goal.id'))
+    def __init__(self, id, text, state, schedule_datetime, order):
+        self.id = id
+        self.text = text
+        self.state = state
+        self.schedule_datetime = schedule_datetime
+        self.order = order
+        self.parents = []
+        self.children = []
+        self.notes = []
 
-    def render_text(self, zone):
-        return '%s  %s%s\n%s' % (
-         format_timestamp(self.id_datetime, zone),
-         SEPARATOR,
-         self.id,
-         self.text)
+    def __repr__(self):
+        return '%s(id=%s)' % (self.__class__.__name__, self.id)
 
 
-def get_database_from_configuration(configuration):
-    database_url = get_database_url(configuration)
-    return configure_database(database_url)
+class NoteRecord(NoteRenderMixin):
+    __slots__ = ('id', 'id_datetime', 'text')
 
+    def __init__(self, id, id_datetime, text=None):
+        self.id = id
+        self.id_datetime = id_datetime
+        self.text = text
 
-def configure_database(database_url):
-    engine = create_engine(database_url, echo=False)
-    Base.metadata.create_all(engine)
-    DatabaseSession = sessionmaker(bind=engine)
-    DatabaseSession.configure(bind=engine)
+    def __repr__(self):
+        return '%s(id=%s)' % (self.__class__.__name__, self.id)
+
+
+def make_ids(database, count):
+    ids = set()
+    with database.no_autoflush:
+        while len(ids) < count:
+            candidate_ids = {make_random_string(
+                ID_LENGTH) for _ in range(count - len(ids))} - ids
+            for Class in Goal, Note:
+                candidate_ids.difference_update(_[0] for _ in database.query(
+                    Class.id).filter(Class.id.in_(candidate_ids)))
+            ids.update(candidate_ids)
+    return list(ids)
+
+
+def get_database_from_configuration(configuration, immutable=False):
+    database_url = get_database_url(configuration, immutable)
+    return configure_database(database_url, get_sqlite_pragma_by_name(
+        configuration))
+
+
+def get_async_engine_from_configuration(configuration):
+    database_url = get_async_database_url(configuration)
+    if not database_url:
+        return
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        return create_async_engine(database_url, echo=False)
+    except ImportError:
+        return
+
+
+def configure_database(database_url, sqlite_pragma_by_name=None):
+    try:
+        DatabaseSession = DATABASE_SESSION_BY_URL[database_url]
+    except KeyError:
+        engine = create_engine(database_url, echo=False)
+        if engine.dialect.name == 'sqlite':
+            prepare_pragmas(engine, sqlite_pragma_by_name or (
+                SQLITE_PRAGMA_BY_NAME))
+        Base.metadata.create_all(engine)
+        migrate_database(engine)
+        DatabaseSession = sessionmaker(bind=engine, info={
+            'search': prepare_search(engine)})
+        event.listen(DatabaseSession, 'after_flush', update_goal_closure)
+        DATABASE_SESSION_BY_URL[database_url] = DatabaseSession
     return DatabaseSession()
 
 
+def prepare_pragmas(engine, pragma_by_name):
+    statements = ['PRAGMA %s = %s' % _ for _ in pragma_by_name.items()]
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
+
+
+def checkpoint_database(database):
+    if database.get_bind().dialect.name != 'sqlite':
+        return False
+    is_busy, log_count, checkpoint_count = database.execute(text(
+        'PRAGMA wal_checkpoint(TRUNCATE)')).first()
+    database.commit()
+    return not is_busy and log_count == checkpoint_count
+
+
+def migrate_database(engine):
+    with engine.begin() as connection:
+        row = connection.execute(select([SchemaVersion.c.version])).first()
+        schema_version = row[0] if row else 0
+        if schema_version >= len(SCHEMA_MIGRATIONS):
+            return
+        for migrate in SCHEMA_MIGRATIONS[schema_version:]:
+            migrate(connection)
+        connection.execute(SchemaVersion.delete())
+        connection.execute(SchemaVersion.insert().values(
+            version=len(SCHEMA_MIGRATIONS)))
+
+
+def add_goal_closure(connection):
+    refresh_goal_closure(connection, [
+        _[0] for _ in connection.execute(select([Goal.id]))])
+
+
+def add_indexes(connection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def update_goal_closure(database, flush_context):
+    new_goals = [_ for _ in database.new if isinstance(_, Goal)]
+    goal_ids = set(_.id for _ in chain(new_goals, database.deleted) if (
+        isinstance(_, Goal)))
+    for instance in chain(new_goals, database.dirty):
+        if not isinstance(instance, Goal):
+            continue
+        attributes = inspect(instance).attrs
+        if attributes.parents.history.has_changes():
+            goal_ids.add(instance.id)
+        children_history = attributes.children.history
+        goal_ids.update(_.id for _ in chain(
+            children_history.added or [], children_history.deleted or []))
+    if goal_ids:
+        refresh_goal_closure(database.connection(), goal_ids)
+
+
+def refresh_goal_closure(connection, goal_ids):
+    goal_ids = set(goal_ids)
+    for chunk_ids in chunk_iterable(sorted(
+            goal_ids), PREFETCH_CHUNK_SIZE):
+        goal_ids.update(_[0] for _ in connection.execute(select([
+            GoalClosure.c.descendant_id]).where(
+                GoalClosure.c.ancestor_id.in_(chunk_ids))))
+    depth_by_ancestor_id_by_id = {}
+    parent_ids_by_id = defaultdict(list)
+    child_ids_by_id = defaultdict(list)
+    for chunk_ids in chunk_iterable(sorted(
+            goal_ids), PREFETCH_CHUNK_SIZE):
+        connection.execute(GoalClosure.delete().where(
+            GoalClosure.c.descendant_id.in_(chunk_ids)))
+        for goal_id, in connection.execute(select([Goal.id]).where(
+                Goal.id.in_(chunk_ids))):
+            depth_by_ancestor_id_by_id[goal_id] = {goal_id: 0}
+        for parent_id, child_id in connection.execute(select([
+                GoalLink.c.parent_id, GoalLink.c.child_id]).where(
+                    GoalLink.c.child_id.in_(chunk_ids))):
+            parent_ids_by_id[child_id].append(parent_id)
+            child_ids_by_id[parent_id].append(child_id)
+    outer_ids = set(chain(*parent_ids_by_id.values())) - goal_ids
+    for chunk_ids in chunk_iterable(sorted(
+            outer_ids), PREFETCH_CHUNK_SIZE):
+        for ancestor_id, goal_id, depth in connection.execute(select([
+                GoalClosure.c.ancestor_id, GoalClosure.c.descendant_id,
+                GoalClosure.c.depth]).where(
+                    GoalClosure.c.descendant_id.in_(chunk_ids))):
+            depth_by_ancestor_id_by_id.setdefault(goal_id, {
+                goal_id: 0})[ancestor_id] = depth
+    remaining_ids = [_ for _ in goal_ids if _ in depth_by_ancestor_id_by_id]
+    while remaining_ids:
+        goal_id = remaining_ids.pop()
+        depth_by_ancestor_id = depth_by_ancestor_id_by_id[goal_id]
+        has_changes = False
+        for parent_id in parent_ids_by_id[goal_id]:
+            for ancestor_id, depth in depth_by_ancestor_id_by_id.get(
+                    parent_id, {parent_id: 0}).items():
+                if ancestor_id == goal_id or depth_by_ancestor_id.get(
+                        ancestor_id, depth + 2) <= depth + 1:
+                    continue
+                depth_by_ancestor_id[ancestor_id] = depth + 1
+                has_changes = True
+        if has_changes:
+            remaining_ids.extend(_ for _ in child_ids_by_id[
+                goal_id] if _ in goal_ids)
+    rows = [{
+        'ancestor_id': ancestor_id, 'descendant_id': goal_id, 'depth': depth,
+    } for goal_id in goal_ids for ancestor_id, depth in (
+        depth_by_ancestor_id_by_id.get(goal_id, {}).items())]
+    if rows:
+        connection.execute(GoalClosure.insert(), rows)
+
+
+def prepare_search(engine):
+    dialect_name = engine.dialect.name
+    try:
+        statements = SEARCH_STATEMENTS_BY_DIALECT[dialect_name]
+    except KeyError:
+        return False
+    try:
+        with engine.begin() as connection:
+            has_search = engine.dialect.has_table(
+                connection, 'goal_text_search')
+            for statement in statements:
+                connection.execute(text(statement))
+            if dialect_name == 'sqlite' and not has_search:
+                connection.execute(text(
+                    'INSERT INTO goal_search_row (goal_id) '
+                    'SELECT id FROM goal'))
+                connection.execute(text(
+                    'INSERT INTO goal_text_search (rowid, text) '
+                    'SELECT goal_search_row.row_id, goal.text '
+                    'FROM goal_search_row '
+                    'JOIN goal ON goal.id = goal_search_row.goal_id'))
+    except DatabaseError:
+        return False
+    return True
+
+
+SEARCH_STATEMENTS_BY_DIALECT = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS goal_text_search USING fts5("
+        "text, content='', tokenize='trigram')",
+        "CREATE TABLE IF NOT EXISTS goal_search_row ("
+        "row_id INTEGER PRIMARY KEY, goal_id VARCHAR UNIQUE NOT NULL)",
+        "DROP TRIGGER IF EXISTS goal_search_insert",
+        "DROP TRIGGER IF EXISTS goal_search_delete",
+        "DROP TRIGGER IF EXISTS goal_search_update",
+        "DROP TABLE IF EXISTS goal_search",
+        "CREATE TRIGGER IF NOT EXISTS goal_text_search_insert "
+        "AFTER INSERT ON goal BEGIN "
+        "INSERT INTO goal_search_row (goal_id) VALUES (new.id); "
+        "INSERT INTO goal_text_search (rowid, text) VALUES ("
+        "(SELECT row_id FROM goal_search_row WHERE goal_id = new.id), "
+        "new.text); "
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS goal_text_search_delete "
+        "AFTER DELETE ON goal BEGIN "
+        "INSERT INTO goal_text_search (goal_text_search, rowid, text) "
+        "VALUES ('delete', ("
+        "SELECT row_id FROM goal_search_row WHERE goal_id = old.id), "
+        "old.text); "
+        "DELETE FROM goal_search_row WHERE goal_id = old.id; "
+        "END",
+        "CREATE TRIGGER IF NOT EXISTS goal_text_search_update "
+        "AFTER UPDATE OF text ON goal BEGIN "
+        "INSERT INTO goal_text_search (goal_text_search, rowid, text) "
+        "VALUES ('delete', ("
+        "SELECT row_id FROM goal_search_row WHERE goal_id = old.id), "
+        "old.text); "
+        "INSERT INTO goal_text_search (rowid, text) VALUES ("
+        "(SELECT row_id FROM goal_search_row WHERE goal_id = new.id), "
+        "new.text); "
+        "END",
+    ],
+    'postgresql': [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "ALTER TABLE goal DROP COLUMN IF EXISTS text_search",
+        "CREATE INDEX IF NOT EXISTS goal_text_trigram_index "
+        "ON goal USING GIN (text gin_trgm_ops)",
+    ],
+}
+SCHEMA_MIGRATIONS = [
+    add_goal_closure,
+    add_indexes,
+]
 PREFIX_BY_STATE = {
     GoalState.Pending: '',
     GoalState.Cancelled: '_ ',
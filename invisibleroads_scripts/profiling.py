@@ -0,0 +1,87 @@
+import json
+import platform
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .models import Base
+
+
+class Profiler(object):
+
+    def __init__(self, is_enabled=True, with_memory=False):
+        self.is_enabled = is_enabled
+        self.with_memory = with_memory
+        self.records = []
+        self.query_count = 0
+        self.row_count = 0
+
+    def start(self):
+        if not self.is_enabled:
+            return
+        event.listen(Engine, 'after_cursor_execute', self._count_query)
+        event.listen(Base, 'load', self._count_row, propagate=True)
+
+    def stop(self):
+        if not self.is_enabled:
+            return
+        event.remove(Engine, 'after_cursor_execute', self._count_query)
+        event.remove(Base, 'load', self._count_row)
+
+    @contextmanager
+    def measure(self, phase_name):
+        if not self.is_enabled:
+            yield
+            return
+        query_count, row_count = self.query_count, self.row_count
+        is_tracing = self.with_memory and not tracemalloc.is_tracing()
+        if is_tracing:
+            tracemalloc.start()
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t
+            memory_size = None
+            if self.with_memory:
+                memory_size = tracemalloc.get_traced_memory()[1]
+            if is_tracing:
+                tracemalloc.stop()
+            self.records.append({
+                'phase': phase_name,
+                'seconds': round(seconds, 6),
+                'queries': self.query_count - query_count,
+                'rows': self.row_count - row_count,
+                'memory': memory_size,
+            })
+
+    def add_rows(self, row_count):
+        self.row_count += row_count
+
+    def format_table(self):
+        lines = ['%-32s %9s %8s %8s %9s' % (
+            'phase', 'seconds', 'queries', 'rows', 'memory')]
+        for record in self.records:
+            memory_size = record['memory']
+            lines.append('%-32s %9.3f %8d %8d %9s' % (
+                record['phase'][:32], record['seconds'], record['queries'],
+                record['rows'], '-' if memory_size is None else '%.1fM' % (
+                    memory_size / 1048576)))
+        return '\n'.join(lines)
+
+    def save(self, log_path, **kw):
+        with open(log_path, 'at') as (log_file):
+            log_file.write(json.dumps({
+                'datetime': datetime.utcnow().isoformat(),
+                'host': platform.node(),
+                'phases': self.records,
+                **kw}) + '\n')
+
+    def _count_query(self, *args):
+        self.query_count += 1
+
+    def _count_row(self, *args):
+        self.row_count += 1
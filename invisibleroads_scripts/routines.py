@@ -1,49 +1,198 @@
-import networkx as nx
+import json
+from bisect import bisect_right
 from collections import defaultdict
-from datetime import datetime
+from hashlib import sha1
 from invisibleroads_macros.disk import make_folder
-from os.path import join
-from sqlalchemy import or_
-from sqlalchemy.orm import joinedload
+from os import cpu_count
+from os.path import exists, join
+from sqlalchemy import (
+    String, and_, bindparam, event, or_, select, text)
+from sqlalchemy.orm import aliased, load_only, selectinload, undefer
 
 from .macros import (
-    parse_text_by_key, parse_timestamp, sort_by_attribute,
-    zone_datetime, DATESTAMP_FORMAT, UTC_TIMEZONE)
-from .models import Goal, GoalCache, GoalState, Note, SEPARATOR
+    chunk_iterable, get_local_datetime, parse_datestamp, parse_timestamp,
+    sort_by_attribute, write_lines, write_text, DATESTAMP_FORMAT)
+from .models import (
+    DateToken, Goal, GoalCache, GoalClosure, GoalLink, GoalRecord, GoalState,
+    GoalToken, LineToken, Note, NoteRecord, NoteToken, SectionToken,
+    PREFETCH_CHUNK_SIZE, SEPARATOR)
+from .profiling import Profiler
+from .settings import ID_LENGTH
 
 
-def get_goals(database, terms=None, with_notes=False):
+BACKUP_CONTEXT = {}
+BACKUP_PATH_COUNT_PER_WORKER = 32
+DIGESTS_NAME = '.digests.json'
+LOG_TOKEN = SectionToken('log')
+
+
+def get_goals(database, terms=None, with_notes=False, profile=None):
     goal_query = database.query(Goal)
     if terms:
         text_expressions = [Goal.id.in_(terms)]
-        for term in terms:
-            text_expressions.append(Goal.text.ilike('%' + term + '%'))
-        if text_expressions:
-            goal_query = goal_query.filter(or_(*text_expressions))
-    if with_notes:
-        goal_query = goal_query.options(joinedload(Goal.notes))
-    return goal_query.options(
-        joinedload(Goal.children),
-        joinedload(Goal.parents),
-    ).order_by(
+        text_expressions.extend(get_text_expression(
+            database, _) for _ in terms)
+        goal_query = goal_query.filter(or_(*text_expressions))
+    if not profile:
+        profile = 'log' if with_notes else 'tasks'
+    goals = goal_query.options(*get_goal_options(profile)).order_by(
         Goal.state,
         Goal.order).all()
+    if terms and goals:
+        get_descendants(database, goals, profile)
+    if len(goals) == 1 and profile == 'tasks':
+        database.query(Note).filter_by(goal_id=goals[0].id).options(
+            undefer(Note.text)).all()
+    return goals
+
+
+def get_descendants(database, goals, profile='tasks'):
+    descendant_ids = select([GoalClosure.c.descendant_id]).where(and_(
+        GoalClosure.c.ancestor_id.in_([_.id for _ in goals]),
+        GoalClosure.c.depth > 0))
+    return database.query(Goal).filter(Goal.id.in_(descendant_ids)).options(
+        *get_goal_options(profile)).all()
 
 
-def get_roots(goals=None):
-    goal_ids = [g.id for g in goals]
+def get_goal_records(database, with_notes=False):
+    return make_goal_records(get_goal_snapshot(database, with_notes))
+
+
+def get_goal_snapshot(database, with_notes=False):
+    goal_table, note_table = Goal.__table__, Note.__table__
+    goal_rows = [tuple(_) for _ in database.execute(select([
+        goal_table.c.id, goal_table.c.text, goal_table.c.state,
+        goal_table.c.schedule_datetime, goal_table.c.order,
+    ]).order_by(goal_table.c.state, goal_table.c.order))]
+    link_rows = [tuple(_) for _ in database.execute(select([
+        GoalLink.c.parent_id, GoalLink.c.child_id]).order_by(
+            GoalLink.c.parent_id, GoalLink.c.child_id))]
+    note_columns = [
+        note_table.c.goal_id, note_table.c.id, note_table.c.id_datetime]
+    if with_notes:
+        note_columns.append(note_table.c.text)
+    note_rows = [tuple(_) for _ in database.execute(select(
+        note_columns).order_by(
+            note_table.c.goal_id, note_table.c.id_datetime,
+            note_table.c.id))]
+    return goal_rows, link_rows, note_rows
+
+
+def make_goal_records(snapshot):
+    goal_rows, link_rows, note_rows = snapshot
+    record_by_id = {_[0]: GoalRecord(*_) for _ in goal_rows}
+    for parent_id, child_id in link_rows:
+        parent = record_by_id.get(parent_id)
+        child = record_by_id.get(child_id)
+        if parent and child:
+            parent.children.append(child)
+            child.parents.append(parent)
+    for goal_id, *note_values in note_rows:
+        goal = record_by_id.get(goal_id)
+        if goal:
+            goal.notes.append(NoteRecord(*note_values))
+    return list(record_by_id.values())
+
+
+def get_goal_options(profile):
+    if profile == 'summary':
+        return [
+            load_only(
+                Goal.id, Goal.text, Goal.state, Goal.schedule_datetime,
+                Goal.order),
+            selectinload(Goal.parents),
+            selectinload(Goal.notes).load_only(Note.id, Note.goal_id),
+        ]
+    options = [
+        selectinload(Goal.children),
+        selectinload(Goal.parents),
+    ]
+    if profile == 'log':
+        options.append(selectinload(Goal.notes))
+    else:
+        options.append(selectinload(Goal.notes).load_only(
+            Note.id, Note.goal_id, Note.id_datetime))
+    return options
+
+
+def get_text_expression(database, term):
+    if database.info.get('search') and len(term.strip()) >= 3 and (
+            database.get_bind().dialect.name == 'sqlite'):
+        return Goal.id.in_(text(
+            'SELECT goal_search_row.goal_id FROM goal_text_search '
+            'JOIN goal_search_row '
+            'ON goal_search_row.row_id = goal_text_search.rowid '
+            'WHERE goal_text_search MATCH :query').bindparams(bindparam(
+                'query', '"%s"' % term.replace('"', '""'), unique=True),
+            ).columns(goal_id=String))
+    return Goal.text.ilike('%' + term + '%')
+
+
+class GoalGraph(object):
+
+    def __init__(self, goals):
+        self.goal_by_id = {}
+        self.parent_ids_by_id = {}
+        self.child_ids_by_id = {}
+        remaining_goals = list(goals)
+        while remaining_goals:
+            goal = remaining_goals.pop()
+            if goal.id in self.goal_by_id:
+                continue
+            self.goal_by_id[goal.id] = goal
+            self.parent_ids_by_id[goal.id] = {_.id for _ in goal.parents}
+            self.child_ids_by_id[goal.id] = {_.id for _ in goal.children}
+            remaining_goals.extend(goal.children)
+        goal_ids = {_.id for _ in goals}
+        self.roots = sort_by_attribute([
+            _ for _ in goals if not self.parent_ids_by_id[_.id] & goal_ids
+        ], 'order')
+        self.children_by_id = {
+            _: self._sort_children(_) for _ in self.goal_by_id}
+        self.digest_by_id = {}
+
+    def get_children(self, goal):
+        return self.children_by_id[goal.id]
+
+    def select_scheduled_goals(self, show_archived=False):
+        return [_ for _ in self.goal_by_id.values() if (
+            _.schedule_datetime and (
+                show_archived or _.state == GoalState.Pending))]
+
+    def get_digest(self, goal):
+        digest_by_id = self.digest_by_id
+        entered_ids = set()
+        remaining_packs = [(goal.id, False)]
+        while remaining_packs:
+            goal_id, is_ready = remaining_packs.pop()
+            if goal_id in digest_by_id:
+                continue
+            child_ids = sorted(self.child_ids_by_id[goal_id])
+            if not is_ready:
+                if goal_id in entered_ids:
+                    continue
+                entered_ids.add(goal_id)
+                remaining_packs.append((goal_id, True))
+                remaining_packs.extend((_, False) for _ in child_ids)
+                continue
+            g = self.goal_by_id[goal_id]
+            digest_by_id[goal_id] = get_digest((
+                g.id, g.text, g.state, g.schedule_datetime, g.order,
+                [(_.id, _.id_datetime, _.text) for _ in g.notes],
+                sorted(self.parent_ids_by_id[goal_id]),
+                [digest_by_id.get(_, _) for _ in child_ids]))
+        return digest_by_id[goal.id]
+
+    def _sort_children(self, goal_id):
+        child_ids = self.child_ids_by_id[goal_id]
+        return sort_by_attribute([
+            _ for _ in self.goal_by_id[goal_id].children
+            if not self.parent_ids_by_id[_.id] & child_ids
+        ], 'order')
 
-    def has_parent(g):
-        for parent in g.parents:
-            if parent.id in goal_ids:
-                return True
-        return False
 
-    roots = []
-    for goal in goals:
-        if not has_parent(goal):
-            roots.append(goal)
-    return roots
+def get_digest(x):
+    return sha1(repr(x).encode('utf-8')).hexdigest()
 
 
 def get_parent(goal_depth, parent_by_indent_depth):
@@ -57,205 +206,415 @@ def get_parent(goal_depth, parent_by_indent_depth):
 
 
 def get_orphan_goals(database):
-    graph = nx.Graph()
-    pending_goals = database.query(Goal).filter_by(
-        state=GoalState.Pending).all()
-    for goal in pending_goals:
-        for parent in goal.parents:
-            if parent.state != GoalState.Pending:
-                continue
-            graph.add_edge(goal.id, parent.id)
-    orphan_goals = []
-    roots = get_roots(pending_goals)
-    for goal in pending_goals:
-        if goal in roots:
-            continue
-        if goal.id not in graph:
-            orphan_goals.append(goal)
-        for root in roots:
-            if root.id not in graph:
-                continue
-            if nx.has_path(graph, goal.id, root.id):
-                break
-        else:
-            orphan_goals.append(goal)
-    return orphan_goals
+    parent, child, root = aliased(Goal), aliased(Goal), aliased(Goal)
+    has_pending_parent = select([GoalLink.c.child_id]).where(and_(
+        GoalLink.c.child_id == root.id,
+        GoalLink.c.parent_id == parent.id,
+        parent.state == GoalState.Pending)).exists()
+    rooted_ids = select([root.id.label('goal_id')]).where(and_(
+        root.state == GoalState.Pending,
+        ~has_pending_parent)).cte('rooted_goal', recursive=True)
+    rooted_ids = rooted_ids.union(select([GoalLink.c.child_id]).where(and_(
+        GoalLink.c.parent_id == rooted_ids.c.goal_id,
+        GoalLink.c.child_id == child.id,
+        child.state == GoalState.Pending)))
+    return database.query(Goal).filter(
+        Goal.state == GoalState.Pending,
+        Goal.id.notin_(select([rooted_ids.c.goal_id]))).options(
+            *get_goal_options('summary')).order_by(Goal.order, Goal.id).all()
 
 
 def format_goal_text(goals, zone, show_archived=False):
-    roots = get_roots(goals)
+    graph = GoalGraph(goals)
     indent_depth = 0
     return '\n'.join(prepare_plan_lines(
-        roots, zone, indent_depth, show_archived))
+        graph, zone, indent_depth, show_archived))
 
 
-def format_schedule_text(goals, zone, show_archived=False):
+def get_scheduled_goals(database):
+    return database.query(Goal).filter(
+        Goal.state == GoalState.Pending,
+        Goal.schedule_datetime.isnot(None)).order_by(
+            Goal.schedule_datetime, Goal.order).all()
+
+
+def format_schedule_text(goals, zone, show_archived=False, graph=None):
+    if graph is None:
+        graph = GoalGraph(goals)
+    return '\n'.join(prepare_schedule_lines(
+        graph.select_scheduled_goals(show_archived), zone))
+
+
+def prepare_schedule_lines(scheduled_goals, zone):
     goals_by_date = defaultdict(list)
-    remaining_goals = list(goals)
-    while remaining_goals:
-        g = remaining_goals.pop()
-        remaining_goals.extend(g.children)
-        if not show_archived and g.state != GoalState.Pending:
-            continue
-        utc_datetime = g.schedule_datetime
-        if not utc_datetime:
-            continue
-        local_datetime = zone_datetime(utc_datetime, UTC_TIMEZONE, zone)
-        selected_goals = goals_by_date[local_datetime.date()]
-        if g not in selected_goals:
-            selected_goals.append(g)
-    lines = []
+    for g in scheduled_goals:
+        local_datetime = get_local_datetime(g.schedule_datetime, zone)
+        goals_by_date[local_datetime.date()].append(g)
     for goal_date in sorted(goals_by_date.keys()):
         selected_goals = goals_by_date[goal_date]
-        sorted_goals = sort_by_attribute(selected_goals, 'schedule_datetime')
-        lines.append(goal_date.strftime(DATESTAMP_FORMAT))
-        lines.extend([g.render_text(
-            zone, indent_depth=1) for g in sorted_goals])
-    return '\n'.join(lines)
+        selected_goals.sort(key=lambda _: (_.schedule_datetime, _.order or 0))
+        yield goal_date.strftime(DATESTAMP_FORMAT)
+        for g in selected_goals:
+            yield g.render_text(zone, indent_depth=1)
 
 
-def format_mission_text(goals, zone, show_archived=False):
-    lines = []
+def format_mission_text(
+        goals, zone, show_archived=False, scheduled_goals=None):
+    return '\n'.join(prepare_mission_lines(
+        goals, zone, show_archived, scheduled_goals))
+
+
+def prepare_mission_lines(
+        goals, zone, show_archived=False, scheduled_goals=None):
 
-    def prepare_section(section_name, section_text):
-        lines.append('# %s' % section_name)
-        if section_text:
-            lines.append(section_text)
-        lines.append('')
+    def prepare_section(section_name, section_lines):
+        yield '# %s' % section_name
+        yield from section_lines
+        yield ''
 
     goal_count = len(goals)
     if goal_count == 1:
         goal = goals[0]
-        prepare_section('Mission', goal.render_text(zone))
-        prepare_section('Log', format_log_text(goal.sorted_notes, zone))
+        yield from prepare_section('Mission', [goal.render_text(zone)])
+        yield from prepare_section('Log', prepare_log_lines(
+            goal.sorted_notes, zone))
         goals = goal.children
-    prepare_section('Schedule', format_schedule_text(
-        goals, zone, show_archived=show_archived))
-    prepare_section('Tasks', '\n'.join(prepare_plan_lines(
-        goals, zone, indent_depth=1, show_archived=show_archived)))
-    return '\n'.join(lines)
-
-
-def prepare_plan_lines(goals, zone, indent_depth, show_archived):
-    lines = []
-    for g in sort_by_attribute(get_roots(goals), 'order'):
+    graph = GoalGraph(goals)
+    if scheduled_goals is None:
+        scheduled_goals = graph.select_scheduled_goals(show_archived)
+    yield from prepare_section('Schedule', prepare_schedule_lines(
+        scheduled_goals, zone))
+    yield from prepare_section('Tasks', prepare_plan_lines(
+        graph, zone, indent_depth=1, show_archived=show_archived))
+
+
+def prepare_plan_lines(graph, zone, indent_depth, show_archived):
+    path_ids = []
+    remaining_packs = [(_, indent_depth) for _ in reversed(graph.roots)]
+    while remaining_packs:
+        g, depth = remaining_packs.pop()
+        del path_ids[depth - indent_depth:]
         if not show_archived and g.state != GoalState.Pending:
             continue
-        lines.append(g.render_text(zone, indent_depth))
-        lines.extend(prepare_plan_lines(
-            g.children, zone, indent_depth + 1, show_archived))
-    return lines
+        if g.id in path_ids:
+            continue
+        path_ids.append(g.id)
+        yield g.render_text(zone, depth)
+        remaining_packs.extend(
+            (_, depth + 1) for _ in reversed(graph.get_children(g)))
 
 
 def format_log_text(notes, zone):
-    return '\n\n'.join(_.render_text(zone) for _ in notes)
+    return '\n'.join(prepare_log_lines(notes, zone))
+
 
+def prepare_log_lines(notes, zone):
+    for index, note in enumerate(notes):
+        if index:
+            yield ''
+        yield note.render_text(zone)
 
-def parse_goal_text(goal_cache, text, zone):
-    goal_by_id = {}
-    parent_by_indent_depth = {}
-    order = 0
-    for line in text.splitlines():
+
+def parse_mission_text(database, text, zone, original_text=None):
+    goal_cache = GoalCache(database)
+    tokens = tokenize_mission_text(text, zone)
+    changed_keys, orders = None, None
+    if original_text is not None:
+        tokens = list(tokens)
+        changed_keys, orders = get_changed_keys(
+            database, tokenize_mission_text(original_text, zone), tokens, zone)
+        if not changed_keys:
+            return []
+        if None in changed_keys:
+            changed_keys, orders = None, None
+    mission_parser = MissionParser(goal_cache, zone, changed_keys, orders)
+    with database.no_autoflush:
+        for chunk in chunk_iterable(tokens, PREFETCH_CHUNK_SIZE):
+            goal_cache.prefetch(get_token_ids(chunk, changed_keys))
+            for token in chunk:
+                mission_parser.parse_token(token)
+        return mission_parser.get_goals()
+
+
+def tokenize_mission_text(text, zone):
+    lines = text.splitlines() if isinstance(text, str) else (
+        line for item in text for line in item.splitlines() or [''])
+    section_name = ''
+    for line in lines:
+        line = line.rstrip()
+        if line.startswith('# '):
+            section_name = line.lstrip('# ').lower()
+            yield SectionToken(section_name)
+            continue
+        if section_name == 'log':
+            timestamp_text, _, id_text = line.partition(SEPARATOR)
+            try:
+                note_datetime = parse_timestamp(
+                    timestamp_text, zone).replace(tzinfo=None)
+            except ValueError:
+                yield LineToken(line)
+            else:
+                yield NoteToken(note_datetime, id_text.strip())
+            continue
         if not line.strip():
             continue
-        goal = Goal.parse_text(goal_cache, line, zone)
-        goal.order = order = order + 1
-        goal_parent = get_parent(goal.indent_depth, parent_by_indent_depth)
-        if not hasattr(goal, 'explicit_parents'):
-            goal.explicit_parents = []
-        if goal_parent:
-            goal.explicit_parents.append(goal_parent)
-        update_parent_by_indent_depth(
-            goal, goal.indent_depth, parent_by_indent_depth)
-        goal_by_id[goal.id] = goal
-    for goal in goal_by_id.values():
-        if not hasattr(goal, 'implicit_parents'):
-            goal.implicit_parents = []
-        for parent in goal.parents:
-            if parent.id in goal_by_id:
+        if section_name == 'schedule':
+            line = line.strip()
+            try:
+                yield DateToken(parse_datestamp(line))
+            except ValueError:
+                pass
+            else:
                 continue
-            goal.implicit_parents.append(parent)
-        goal.parents = goal.explicit_parents + goal.implicit_parents
-    return list(goal_by_id.values())
-
-
-def parse_schedule_text(goal_cache, text, zone):
-    goals = []
-    date = None
-    for line in text.splitlines():
-        line = line.strip()
-        try:
-            date = datetime.strptime(line, DATESTAMP_FORMAT)
-        except ValueError:
-            pass
-        else:
+        if section_name in ('mission', 'schedule', 'tasks'):
+            yield Goal.tokenize_text(line)
+
+
+def get_token_ids(tokens, changed_keys=None):
+    ids = set()
+    for token in tokens:
+        if isinstance(token, GoalToken):
+            ids.update(_ for _ in token.meta_text.split() if len(
+                _) == ID_LENGTH and (changed_keys is None or (
+                    _ in changed_keys)))
+        elif isinstance(token, NoteToken) and token.id and (
+                changed_keys is None or LOG_TOKEN in changed_keys):
+            ids.add(token.id)
+    return ids
+
+
+def get_changed_keys(database, original_tokens, tokens, zone):
+    original_facts = set(_ for _ in prepare_mission_facts(
+        original_tokens, zone) if _[1] != 'order')
+    facts = list(prepare_mission_facts(tokens, zone))
+    key_by_position = {v: k for k, kind, v in facts if kind == 'order'}
+    ordered_keys = [key_by_position.get(_) for _ in range(1, max(
+        key_by_position, default=0) + 1)]
+    changed_keys = set(_[0] for _ in original_facts ^ set(
+        _ for _ in facts if _[1] != 'order'))
+    order_by_id = get_order_by_id(database, ordered_keys)
+    orders = fit_orders([order_by_id.get(_) for _ in ordered_keys])
+    changed_keys.update(k for k, order in zip(
+        ordered_keys, orders) if k is not None and order_by_id.get(
+            k) != order)
+    return changed_keys, orders
+
+
+def prepare_mission_facts(tokens, zone):
+    section_name = ''
+    section_index = 0
+    log_index = 0
+    mission_key = None
+    schedule_date = None
+    schedule_keys = {}
+    parent_key_by_indent_depth = {}
+    position_by_key = {}
+    position = 0
+    for token in tokens:
+        if isinstance(token, SectionToken):
+            section_name = token.name
+            section_index += 1
+            yield None, section_index, token
             continue
-        goal = Goal.parse_text(goal_cache, line, zone)
-        goal.set_schedule_date(date, zone)
-        goals.append(goal)
-    return goals
-
-
-def parse_mission_text(database, text, zone):
-    goal_cache = GoalCache(database)
-    text_by_key = parse_text_by_key(text, '# ', lambda line: line.lower())
-    mission_text = text_by_key.get('mission', '')
-    log_text = text_by_key.get('log', '')
-    schedule_text = text_by_key.get('schedule', '')
-    tasks_text = text_by_key.get('tasks', '')
-    try:
-        mission_goal = Goal.parse_text(
-            goal_cache, mission_text.splitlines()[0], zone)
-    except (KeyError, IndexError):
-        mission_goal = None
-    else:
-        mission_goal.notes = parse_log_text(database, log_text, zone)
-    goals = parse_goal_text(goal_cache, tasks_text, zone)
-    goal_by_id = {_.id: _ for _ in goals}
-    for g in parse_schedule_text(goal_cache, schedule_text, zone):
-        try:
-            goal = goal_by_id[g.id]
-        except KeyError:
-            g.order = len(goals)
-            goals.append(g)
+        if section_name == 'log':
+            log_index += 1
+            yield LOG_TOKEN, log_index, token
+            continue
+        if isinstance(token, DateToken):
+            schedule_date = token.date
+            continue
+        goal_key = Goal.parse_token_id(token, zone) or object()
+        yield goal_key, section_name, token
+        if section_name == 'mission' and mission_key is None:
+            mission_key = goal_key
+            yield LOG_TOKEN, 'mission', goal_key
+        elif section_name == 'schedule':
+            schedule_keys[goal_key] = schedule_date
+            yield goal_key, 'date', schedule_date
+        elif section_name == 'tasks':
+            position += 1
+            position_by_key[goal_key] = position
+            parent_key = get_parent(
+                token.indent_depth, parent_key_by_indent_depth)
+            update_parent_by_indent_depth(
+                goal_key, token.indent_depth, parent_key_by_indent_depth)
+            yield goal_key, 'parent', parent_key
+    for goal_key in schedule_keys:
+        if goal_key not in position_by_key:
+            position += 1
+            yield goal_key, 'order', position
+    for goal_key, position in position_by_key.items():
+        yield goal_key, 'order', position
+
+
+def fit_orders(orders):
+    tail_values, tail_indices = [], []
+    previous_indices = [None] * len(orders)
+    for index, order in enumerate(orders):
+        if order is None:
+            continue
+        value = order - index
+        tail_index = bisect_right(tail_values, value)
+        if tail_index:
+            previous_indices[index] = tail_indices[tail_index - 1]
+        if tail_index == len(tail_values):
+            tail_values.append(value)
+            tail_indices.append(index)
         else:
-            goal.schedule_datetime = g.schedule_datetime
-    if mission_goal:
-        for g in goals:
-            if not g.parents:
-                g.parents.append(mission_goal)
-        goals.append(mission_goal)
-    return goals
-
+            tail_values[tail_index] = value
+            tail_indices[tail_index] = index
+    anchor_indices = []
+    index = tail_indices[-1] if tail_indices else None
+    while index is not None:
+        anchor_indices.append(index)
+        index = previous_indices[index]
+    anchor_index = anchor_indices.pop() if anchor_indices else None
+    offset = 1 if anchor_index is None else orders[anchor_index] - anchor_index
+    fitted_orders = []
+    for index in range(len(orders)):
+        if index == anchor_index:
+            offset = orders[index] - index
+            anchor_index = anchor_indices.pop() if anchor_indices else None
+        fitted_orders.append(index + offset)
+    return fitted_orders
+
+
+def get_order_by_id(database, goal_ids):
+    order_by_id = {}
+    goal_ids = sorted(_ for _ in set(goal_ids) if isinstance(_, str))
+    for chunk_ids in chunk_iterable(goal_ids, PREFETCH_CHUNK_SIZE):
+        order_by_id.update(database.query(Goal.id, Goal.order).filter(
+            Goal.id.in_(chunk_ids)))
+    return order_by_id
+
+
+class MissionParser(object):
+
+    def __init__(self, goal_cache, zone, changed_keys=None, orders=None):
+        self.goal_cache = goal_cache
+        self.zone = zone
+        self.changed_keys = changed_keys
+        self.orders = orders
+        self.section_name = ''
+        self.mission_goal = None
+        self.notes = []
+        self.note_token = None
+        self.note_lines = []
+        self.has_log = changed_keys is None or LOG_TOKEN in changed_keys
+        self.task_ids = set()
+        self.task_goal_by_id = {}
+        self.explicit_parents_by_id = defaultdict(list)
+        self.parent_id_by_indent_depth = {}
+        self.order = 0
+        self.schedule_date = None
+        self.scheduled_goal_by_id = {}
+        self.schedule_datetime_by_id = {}
+
+    def parse_token(self, token):
+        if isinstance(token, SectionToken):
+            self._parse_note()
+            self.section_name = token.name
+            return
+        try:
+            parse = getattr(self, '_parse_%s_token' % self.section_name)
+        except AttributeError:
+            return
+        parse(token)
+
+    def get_goals(self):
+        self._parse_note()
+        goals = list(self.task_goal_by_id.values())
+        for goal in goals:
+            implicit_parents = [
+                _ for _ in goal.parents if _.id not in self.task_ids]
+            goal.parents = self.explicit_parents_by_id[
+                goal.id] + implicit_parents
+        for goal_id, schedule_datetime in self.schedule_datetime_by_id.items():
+            is_task = goal_id in self.task_ids
+            if not is_task:
+                self.order += 1
+            goal = self.scheduled_goal_by_id.get(goal_id)
+            if not goal:
+                continue
+            if not is_task:
+                goal.order = self.get_order()
+                goals.append(goal)
+            goal.schedule_datetime = schedule_datetime
+        mission_goal = self.mission_goal
+        if mission_goal:
+            for g in goals:
+                if not g.parents:
+                    g.parents.append(mission_goal)
+            if self.has_log:
+                mission_goal.notes = self.notes
+            goals.append(mission_goal)
+        return goals
+
+    def get_order(self):
+        if self.orders is None:
+            return self.order
+        return self.orders[self.order - 1]
+
+    def _parse_mission_token(self, token):
+        if self.mission_goal:
+            return
+        self.mission_goal = Goal.parse_token(self.goal_cache, token, self.zone)
 
-def parse_log_text(database, text, zone):
-    notes = []
-    note_datetime = None
-    note_id = None
-    note_lines = []
+    def _parse_log_token(self, token):
+        if not self.has_log:
+            return
+        if isinstance(token, NoteToken):
+            self._parse_note()
+            self.note_token = token
+        else:
+            self.note_lines.append(token.text)
 
-    def process_note(note_id, note_datetime, note_lines):
-        note_text = '\n'.join(note_lines).strip()
-        note_lines.clear()
+    def _parse_note(self):
+        note_token = self.note_token
+        note_text = '\n'.join(self.note_lines).strip()
+        self.note_token = None
+        self.note_lines = []
         if not note_text:
             return
-        note = Note.get(database, note_id)
-        if note_datetime:
-            note.id_datetime = note_datetime
+        note = self.goal_cache.get_note(note_token.id if note_token else None)
+        if note_token:
+            note.id_datetime = note_token.datetime
         note.set_text(note_text)
-        notes.append(note)
+        self.notes.append(note)
 
-    for line in text.splitlines():
-        timestamp_text, _, id_text = line.partition(SEPARATOR)
-        try:
-            note_datetime = parse_timestamp(timestamp_text, zone)
-            note_id = id_text.strip()
-        except ValueError:
-            note_lines.append(line)
-            continue
-        process_note(note_id, note_datetime, note_lines)
-    process_note(note_id, note_datetime, note_lines)
-    return notes
+    def _parse_schedule_token(self, token):
+        if isinstance(token, DateToken):
+            self.schedule_date = token.date
+            return
+        goal_id, goal = self._parse_goal_token(token)
+        if goal:
+            goal.set_schedule_date(self.schedule_date, self.zone)
+            self.scheduled_goal_by_id[goal_id] = goal
+        self.schedule_datetime_by_id[goal_id] = goal and goal.schedule_datetime
+
+    def _parse_tasks_token(self, token):
+        self.order += 1
+        goal_id, goal = self._parse_goal_token(token)
+        parent_id = get_parent(
+            token.indent_depth, self.parent_id_by_indent_depth)
+        update_parent_by_indent_depth(
+            goal_id, token.indent_depth, self.parent_id_by_indent_depth)
+        self.task_ids.add(goal_id)
+        if not goal:
+            return
+        goal.order = self.get_order()
+        if parent_id:
+            self.explicit_parents_by_id[goal_id].append(
+                self.goal_cache.get(parent_id))
+        self.task_goal_by_id[goal_id] = goal
+
+    def _parse_goal_token(self, token):
+        if self.changed_keys is not None:
+            goal_id = Goal.parse_token_id(token, self.zone)
+            if goal_id and goal_id not in self.changed_keys:
+                return goal_id, None
+        goal = Goal.parse_token(self.goal_cache, token, self.zone)
+        return goal.id, goal
 
 
 def update_parent_by_indent_depth(goal, goal_depth, parent_by_indent_depth):
@@ -269,29 +628,192 @@ def update_parent_by_indent_depth(goal, goal_depth, parent_by_indent_depth):
     parent_by_indent_depth[goal_depth] = goal
 
 
-def backup_database(target_folder, database, timezone, terms=None):
-    goals = get_goals(database, terms, with_notes=True)
-    text = format_mission_text(goals, timezone, show_archived=True)
-    target_folder = make_folder(target_folder)
-    target_name = ' '.join(terms) if terms else 'goals'
-    target_path = join(target_folder, f'{target_name}.md')
-    open(target_path, 'wt').write(text)
-    for goal in goals:
-        if not goal.notes:
-            continue
-        text = format_mission_text([goal], timezone, show_archived=True)
-        target_name = goal.id
+def save_goals(database, goals):
+    row_counts = []
+
+    def count_rows(
+            connection, cursor, statement, parameters, context, executemany):
+        if not context.isinsert and not context.isupdate and not (
+                context.isdelete):
+            return
+        if context.compiled.statement.table is GoalClosure:
+            return
+        row_counts.append(max(cursor.rowcount, 0))
+
+    engine = database.get_bind()
+    event.listen(engine, 'after_cursor_execute', count_rows)
+    try:
+        database.add_all(goals)
+        database.commit()
+    finally:
+        event.remove(engine, 'after_cursor_execute', count_rows)
+    return sum(row_counts)
+
+
+def backup_database(
+        target_folder, database, timezone, terms=None, incremental=False):
+    backup_databases(
+        {terms: target_folder}, database, timezone, incremental=incremental)
+
+
+def backup_databases(
+        folder_by_terms, database, timezone, incremental=False,
+        worker_count=1, profiler=None):
+    profiler = profiler or Profiler(is_enabled=False)
+    with profiler.measure('backup load'):
+        snapshot = get_goal_snapshot(database, with_notes=True)
+        profiler.add_rows(sum(len(_) for _ in snapshot))
+        all_goals = make_goal_records(snapshot)
+        graph = GoalGraph(all_goals)
+    goals_by_path = {}
+    digest_by_name_by_path = {}
+
+    def backup(target_folder, target_name, goals, goal_digests):
         target_path = join(target_folder, f'{target_name}.md')
-        open(target_path, 'wt').write(text)
+        digest = get_digest((str(timezone), goal_digests))
+        old_digest = digest_by_name.get(target_name)
+        digest_by_name[target_name] = digest
+        if old_digest == digest and exists(target_path):
+            return
+        goals_by_path[target_path] = goals
+
+    for terms, target_folder in folder_by_terms.items():
+        with profiler.measure(f'backup {target_folder}'):
+            goals = filter_goals(all_goals, terms)
+            target_folder = make_folder(target_folder)
+            digests_path = join(target_folder, DIGESTS_NAME)
+            if digests_path not in digest_by_name_by_path:
+                digest_by_name_by_path[digests_path] = load_digests(
+                    digests_path) if incremental else {}
+            digest_by_name = digest_by_name_by_path[digests_path]
+            target_name = ' '.join(terms) if terms else 'goals'
+            backup(target_folder, target_name, goals, [
+                graph.get_digest(_) for _ in goals])
+            for goal in goals:
+                if not goal.notes:
+                    continue
+                backup(target_folder, goal.id, [goal], [
+                    graph.get_digest(goal)])
+
+    with profiler.measure('backup write'):
+        worker_count = min(worker_count, cpu_count() or 1, len(
+            goals_by_path) // BACKUP_PATH_COUNT_PER_WORKER)
+        if worker_count > 1:
+            write_backups_concurrently(
+                snapshot, goals_by_path, timezone, worker_count)
+        else:
+            write_backups(goals_by_path, timezone)
+        if not incremental:
+            return
+        for digests_path, digest_by_name in digest_by_name_by_path.items():
+            write_text(digests_path, json.dumps(
+                digest_by_name, indent=0, sort_keys=True))
+
+
+def write_backups(goals_by_path, timezone):
+    path_by_id = {}
+    for target_path, goals in goals_by_path.items():
+        goal_id = goals[0].id if len(goals) == 1 else None
+        if goal_id in path_by_id:
+            with open(path_by_id[goal_id], 'rt') as source_file:
+                write_lines(target_path, source_file, separator='')
+            continue
+        write_lines(target_path, prepare_mission_lines(
+            goals, timezone, show_archived=True))
+        if goal_id:
+            path_by_id[goal_id] = target_path
+
+
+def write_backups_concurrently(
+        snapshot, goals_by_path, timezone, worker_count):
+    from concurrent.futures import ProcessPoolExecutor
+    paths_by_goal_ids = defaultdict(list)
+    for target_path, goals in goals_by_path.items():
+        paths_by_goal_ids[tuple(_.id for _ in goals)].append(target_path)
+    goal_ids_by_path_list = [{} for _ in range(worker_count)]
+    for index, (goal_ids, target_paths) in enumerate(sorted(
+            paths_by_goal_ids.items(), key=lambda _: -len(_[0]))):
+        goal_ids_by_path = goal_ids_by_path_list[index % worker_count]
+        for target_path in target_paths:
+            goal_ids_by_path[target_path] = goal_ids
+    with ProcessPoolExecutor(
+            worker_count, initializer=load_backup_snapshot,
+            initargs=(snapshot, timezone)) as executor:
+        list(executor.map(write_backups_from_snapshot, goal_ids_by_path_list))
+
+
+def load_backup_snapshot(snapshot, timezone):
+    BACKUP_CONTEXT['goal_by_id'] = {
+        _.id: _ for _ in make_goal_records(snapshot)}
+    BACKUP_CONTEXT['timezone'] = timezone
+
+
+def write_backups_from_snapshot(goal_ids_by_path):
+    goal_by_id = BACKUP_CONTEXT['goal_by_id']
+    write_backups({
+        target_path: [goal_by_id[_] for _ in goal_ids]
+        for target_path, goal_ids in goal_ids_by_path.items()
+    }, BACKUP_CONTEXT['timezone'])
+
+
+def filter_goals(goals, terms=None):
+    if not terms:
+        return list(goals)
+    lowered_terms = [_.lower() for _ in terms]
+    return [g for g in goals if g.id in terms or any(
+        _ in (g.text or '').lower() for _ in lowered_terms)]
+
+
+def load_digests(digests_path):
+    try:
+        return json.load(open(digests_path, 'rt'))
+    except (OSError, ValueError):
+        return {}
 
 
 def format_summary(database, zone):
+    return format_summary_text(
+        get_orphan_lines(database, zone), count_pending_goals(database))
+
+
+def format_summary_text(orphan_lines, pending_count):
     lines = []
-    orphan_goals = get_orphan_goals(database)
-    if orphan_goals:
-        lines.append('%s orphaned' % len(orphan_goals))
-        lines.extend(g.render_text(zone, indent_depth=1) for g in orphan_goals)
-    pending_count = database.query(Goal).filter_by(
-        state=GoalState.Pending).count()
+    if orphan_lines:
+        lines.append('%s orphaned' % len(orphan_lines))
+        lines.extend(orphan_lines)
     lines.append('%s pending' % pending_count)
     return '\n'.join(lines)
+
+
+def get_orphan_lines(database, zone):
+    return [g.render_text(zone, indent_depth=1) for g in get_orphan_goals(
+        database)]
+
+
+def count_pending_goals(database):
+    return database.query(Goal).filter_by(state=GoalState.Pending).count()
+
+
+async def report_concurrently(
+        async_engine, folder_by_terms, timezone, incremental=False,
+        worker_count=1):
+    import asyncio
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    async def run(f, *args):
+        async with AsyncSession(async_engine) as database:
+            return await database.run_sync(f, *args)
+
+    def backup(database):
+        backup_databases(
+            folder_by_terms, database, timezone, incremental=incremental,
+            worker_count=worker_count)
+
+    try:
+        _, orphan_lines, pending_count = await asyncio.gather(
+            run(backup),
+            run(get_orphan_lines, timezone),
+            run(count_pending_goals))
+    finally:
+        await async_engine.dispose()
+    return format_summary_text(orphan_lines, pending_count)
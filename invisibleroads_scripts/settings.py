@@ -1,4 +1,5 @@
 import pytz
+import re
 from datetime import datetime
 from invisibleroads_macros.disk import make_folder
 from invisibleroads_macros.exceptions import InvisibleRoadsError
@@ -9,6 +10,14 @@ from os.path import dirname, expanduser, join
 CONFIGURATION_PATH = expanduser('~/.invisibleroads/configuration.ini')
 ID_LENGTH = 7
 INDENT = '    '
+SQLITE_PRAGMA_BY_NAME = {
+    'journal_mode': 'delete',
+    'synchronous': 'normal',
+    'cache_size': '-65536',
+    'mmap_size': '0',
+    'temp_store': 'memory',
+}
+SQLITE_PRAGMA_PATTERN = re.compile(r'^-?\w+$')
 
 
 def get_value(d, section_name, option_name, default_value=None):
@@ -28,7 +37,11 @@ def get_archive_folder(d):
     return get_value(d, 'archive', 'folder', v)
 
 
-def get_database_url(d):
+def get_archive_worker_count(d):
+    return int(get_value(d, 'archive', 'worker_count', '1'))
+
+
+def get_database_url(d, immutable=False):
     try:
         dialect = d['database']['dialect']
     except KeyError:
@@ -36,6 +49,8 @@ def get_database_url(d):
     if dialect == 'sqlite':
         path = get_database_path(d)
         make_folder(dirname(path))
+        if immutable:
+            return f'{dialect}:///file:{path}?mode=ro&immutable=1&uri=true'
         return f'{dialect}:///{path}'
     try:
         username = get_value(d, 'database', 'username')
@@ -48,11 +63,53 @@ def get_database_url(d):
     return f'{dialect}://{username}:{password}@{host}:{port}/{name}'
 
 
+def get_async_database_url(d):
+    database_url = get_database_url(d)
+    dialect, _, address = database_url.partition('://')
+    if dialect != 'postgresql':
+        return
+    return f'{dialect}+asyncpg://{address}'
+
+
 def get_database_path(d):
     v = join(get_archive_folder(d), 'goals.sqlite')
     return get_value(d, 'database', 'path', v)
 
 
+def get_sqlite_pragma_by_name(d):
+    pragma_by_name = {}
+    for name, default_value in SQLITE_PRAGMA_BY_NAME.items():
+        value = get_value(d, 'sqlite', name, default_value).strip()
+        if not SQLITE_PRAGMA_PATTERN.match(value):
+            raise InvisibleRoadsError(f'sqlite {name} is invalid: {value}')
+        pragma_by_name[name] = value
+    return pragma_by_name
+
+
+def is_sqlite_immutable(d):
+    return get_flag(d, 'sqlite', 'immutable')
+
+
+def is_profile_enabled(d):
+    return get_flag(d, 'profile', 'enabled')
+
+
+def is_profile_memory_enabled(d):
+    return get_flag(d, 'profile', 'memory')
+
+
+def get_profile_log_path(d):
+    try:
+        return get_value(d, 'profile', 'log_path')
+    except KeyError:
+        return
+
+
+def get_flag(d, section_name, option_name):
+    v = get_value(d, section_name, option_name, 'false')
+    return v.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
 def get_editor_command(d):
     v = environ.get('EDITOR', 'vim')
     return get_value(d, 'editor', 'command', v)
@@ -23,16 +23,18 @@ setup(
     author_email='rhh@crosscompute.com',
     url='https://github.com/invisibleroads/invisibleroads-scripts',
     keywords='invisibleroads',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     include_package_data=True,
     zip_safe=True,
     install_requires=[
         'invisibleroads',
         'invisibleroads-macros',
-        'networkx',
         'psycopg2',
         'psycopg2-binary',
         'pytz',
-        'sqlalchemy',
+        'sqlalchemy>=1.4,<2',
     ],
+    extras_require={
+        'async': ['asyncpg'],
+    },
     entry_points=ENTRY_POINTS)
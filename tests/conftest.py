@@ -1,4 +1,6 @@
+from invisibleroads_scripts.models import configure_database
 from os.path import dirname, join
+from pytest import fixture
 
 
 FOLDER = dirname(__file__)
@@ -17,3 +19,11 @@ MISSION_TEXTS = [
     load('mission4.md'),
     load('missionX.md'),
 ]
+
+
+@fixture
+def database(tmp_path):
+    database = configure_database('sqlite:///' + str(
+        tmp_path / 'goals.sqlite'))
+    yield database
+    database.close()
@@ -0,0 +1,20 @@
+import pytz
+from invisibleroads_scripts.macros import format_timestamp, parse_timestamp
+from pytest import raises
+
+
+ZONE = pytz.timezone('US/Eastern')
+
+
+def test_parse_timestamp():
+    assert parse_timestamp('20200105', ZONE).hour == 5
+    assert parse_timestamp('20200705-1330', ZONE).hour == 17
+    with raises(ValueError):
+        parse_timestamp('abc1234', ZONE)
+    with raises(ValueError):
+        parse_timestamp('20201305', ZONE)
+
+
+def test_format_timestamp():
+    for text in '20200105-0000', '20200705-1330', '20201101-0130':
+        assert format_timestamp(parse_timestamp(text, ZONE), ZONE) == text
@@ -0,0 +1,59 @@
+import pytz
+from invisibleroads_scripts.models import (
+    Base, Goal, GoalClosure, SchemaVersion, configure_database, make_ids,
+    migrate_database, ID_BATCH_SIZE, SCHEMA_MIGRATIONS)
+from invisibleroads_scripts.routines import parse_mission_text, save_goals
+from sqlalchemy import create_engine, event, inspect, select
+
+
+def test_goal_closure():
+    database = configure_database('sqlite://')
+    a, b, c = [Goal(id=_ * 7, text=_) for _ in 'abc']
+    b.parents.append(a)
+    c.parents.append(b)
+    database.add_all([a, b, c])
+    database.commit()
+    assert get_depth_by_pair(database) == {
+        ('aaaaaaa', 'aaaaaaa'): 0, ('bbbbbbb', 'bbbbbbb'): 0,
+        ('ccccccc', 'ccccccc'): 0, ('aaaaaaa', 'bbbbbbb'): 1,
+        ('bbbbbbb', 'ccccccc'): 1, ('aaaaaaa', 'ccccccc'): 2}
+    b.parents = []
+    database.commit()
+    assert get_depth_by_pair(database) == {
+        ('aaaaaaa', 'aaaaaaa'): 0, ('bbbbbbb', 'bbbbbbb'): 0,
+        ('ccccccc', 'ccccccc'): 0, ('bbbbbbb', 'ccccccc'): 1}
+
+
+def get_depth_by_pair(database):
+    return {(_.ancestor_id, _.descendant_id): _.depth for _ in database.query(
+        GoalClosure)}
+
+
+def test_make_ids(database):
+    ids = make_ids(database, ID_BATCH_SIZE)
+    assert len(set(ids)) == ID_BATCH_SIZE
+    assert ids != sorted(ids)
+
+    statements = []
+    event.listen(
+        database.get_bind(), 'before_cursor_execute',
+        lambda *args: statements.append(args[2]))
+    goals = parse_mission_text(database, '# Tasks\n' + '\n'.join(
+        'goal %s' % _ for _ in range(5)), pytz.UTC)
+    assert not [_ for _ in statements if _.startswith('INSERT')]
+    assert len({_.id for _ in goals}) == 5
+    save_goals(database, goals)
+    assert database.query(Goal).count() == 5
+
+
+def test_migrate_database(tmp_path):
+    engine = create_engine('sqlite:///%s' % (tmp_path / 'goals.sqlite'))
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for index in Goal.__table__.indexes:
+            index.drop(connection)
+    migrate_database(engine)
+    assert inspect(engine).get_indexes('goal')
+    with engine.begin() as connection:
+        assert connection.execute(select([
+            SchemaVersion.c.version])).scalar() == len(SCHEMA_MIGRATIONS)
@@ -0,0 +1,46 @@
+import json
+import pytz
+from invisibleroads_scripts import routines
+from invisibleroads_scripts.models import Goal
+from invisibleroads_scripts.profiling import Profiler
+
+
+def test_profiler(database, tmp_path):
+    database.add_all([Goal(id=_ * 7, text=_) for _ in 'ab'])
+    database.commit()
+    database.expunge_all()
+    profiler = Profiler()
+    profiler.start()
+    with profiler.measure('load'):
+        database.query(Goal).all()
+    profiler.stop()
+    with profiler.measure('ignore'):
+        database.query(Goal).all()
+    record, = profiler.records[:1]
+    assert record['phase'] == 'load'
+    assert record['queries'] == 1
+    assert record['rows'] == 2
+    assert record['memory'] is None
+    assert 'load' in profiler.format_table()
+    log_path = tmp_path / 'profiles.jsonl'
+    profiler.save(log_path, terms=['x'])
+    assert json.loads(log_path.read_text())['terms'] == ['x']
+
+    profiler = Profiler(with_memory=True)
+    profiler.start()
+    with profiler.measure('load'):
+        database.query(Goal).all()
+    routines.backup_databases(
+        {None: str(tmp_path)}, database, pytz.UTC, profiler=profiler)
+    profiler.stop()
+    record_by_phase = {_['phase']: _ for _ in profiler.records}
+    assert record_by_phase['load']['memory'] > 0
+    assert record_by_phase['backup load']['rows'] == 2
+    assert 'M' in profiler.format_table()
+
+    profiler = Profiler(is_enabled=False)
+    profiler.start()
+    with profiler.measure('load'):
+        database.query(Goal).all()
+    profiler.stop()
+    assert profiler.records == []
@@ -1,4 +1,13 @@
+import io
+import pytz
 from conftest import MISSION_TEXTS
+from datetime import datetime
+from invisibleroads_scripts import routines
+from invisibleroads_scripts.macros import sort_by_attribute
+from invisibleroads_scripts.models import (
+    Goal as GoalModel, GoalState, GoalToken, Note, SectionToken)
+from invisibleroads_scripts.routines import (
+    prepare_mission_facts, tokenize_mission_text)
 from models import Goal
 from routines import format_mission_text, parse_mission_text
 
@@ -30,3 +39,210 @@ def test_format_mission_text():
     })
     # Reconsider whether to allow many to many for goals
     """
+
+
+def test_tokenize_mission_text():
+    tokens = list(tokenize_mission_text(MISSION_TEXTS[4], pytz.UTC))
+    assert tokens == [
+        SectionToken('tasks'),
+        GoalToken(4, GoalState.Pending, 'Exercise  ', 'A'),
+        GoalToken(8, GoalState.Pending, 'Do 10 pullups  ', 'B'),
+        GoalToken(4, GoalState.Pending, 'Sleep  ', 'C'),
+    ]
+
+
+def test_tokenize_mission_file():
+    text = (
+        '# Mission\nm  # mmmmmmm\n\n# Log\n20200101-0000  # nnnnnnn\n'
+        'line1\nline2\n\n20200102-0000  # ooooooo\nline3\n\n'
+        '# Tasks\n    a  # aaaaaaa\n')
+    tokens = list(tokenize_mission_text(text, pytz.UTC))
+    assert list(tokenize_mission_text(io.StringIO(text), pytz.UTC)) == tokens
+    assert list(tokenize_mission_text(
+        text.splitlines(), pytz.UTC)) == tokens
+
+
+def test_prepare_mission_facts():
+
+    def get_changed_keys(original_text, text):
+        original_facts = set(prepare_mission_facts(
+            tokenize_mission_text(original_text, pytz.UTC), pytz.UTC))
+        facts = set(prepare_mission_facts(
+            tokenize_mission_text(text, pytz.UTC), pytz.UTC))
+        return set(_[0] for _ in original_facts ^ facts)
+
+    text = '# Tasks\nA  # aaaaaaa\n    B  # bbbbbbb\nC  # ccccccc'
+    assert get_changed_keys(text, text) == set()
+    assert get_changed_keys(text, text.replace('B ', 'D ')) == {'bbbbbbb'}
+    assert get_changed_keys(text, text.replace('    B', 'B')) == {'bbbbbbb'}
+    assert get_changed_keys(text, text.replace('\nC', '\n    C')) == {
+        'ccccccc'}
+
+
+def test_get_goals_by_terms(database):
+    assert database.info['search']
+    database.add_all([GoalModel(id=_ * 7, text=text, order=i) for i, (
+        _, text) in enumerate(zip('abcde', [
+            'unhappy customer', 'happy hour', 'Call mom', 'ship it', None]))])
+    database.commit()
+    all_goals = routines.get_goals(database)
+    for terms in [
+            ['happ'], ['happ', 'call'], ['OM'], ['p i'], ['x'], ['a' * 7]]:
+        assert {_.id for _ in routines.get_goals(database, terms)} == {
+            _.id for _ in routines.filter_goals(all_goals, terms)}
+    database.delete(database.query(GoalModel).get('a' * 7))
+    database.commit()
+    database.close()
+    with database.get_bind().connect() as connection:
+        connection.exec_driver_sql('VACUUM')
+    database.query(GoalModel).get('c' * 7).text = 'Call dad'
+    database.commit()
+    assert 'MATCH' in str(routines.get_text_expression(database, 'dad'))
+    assert [_.id for _ in routines.get_goals(database, ['dad'])] == ['c' * 7]
+    assert [_.id for _ in routines.get_goals(database, ['ship'])] == [
+        'd' * 7]
+
+
+def test_parse_mission_edit(database):
+    mission = GoalModel(id='m' * 7, text='m', order=1)
+    mission.notes.append(Note(
+        id='n' * 7, id_datetime=datetime(2020, 1, 1), text='x\ny'))
+    goals = [GoalModel(id=_ * 7, text=_, order=i) for i, _ in enumerate(
+        'abc', 2)]
+    for goal in goals:
+        goal.parents.append(mission)
+    database.add_all([mission] + goals)
+    database.commit()
+    lines = list(routines.prepare_mission_lines(
+        routines.get_goals(database, ['m' * 7]), pytz.UTC))
+    text = '\n'.join(lines)
+    assert routines.parse_mission_text(
+        database, text, pytz.UTC, original_text=lines) == []
+    goals = routines.parse_mission_text(database, text.replace(
+        '# Tasks\n', '# Tasks\n    d\n'), pytz.UTC, original_text=lines)
+    assert [_.text for _ in goals] == ['d', 'm']
+    routines.save_goals(database, goals)
+    assert [_.text for _ in sort_by_attribute(database.query(GoalModel).get(
+        'm' * 7).children, 'order')] == ['d', 'a', 'b', 'c']
+
+
+def test_fit_orders():
+    assert routines.fit_orders([]) == []
+    assert routines.fit_orders([None, None]) == [1, 2]
+    assert routines.fit_orders([None, 1, 2, 3]) == [0, 1, 2, 3]
+    assert routines.fit_orders([1, 2, None, 3, 4, 5]) == [0, 1, 2, 3, 4, 5]
+    assert routines.fit_orders([1, 5, 3, 4]) == [1, 2, 3, 4]
+
+
+def test_get_orphan_goals(database):
+    r, d, c1, c2, c3 = [GoalModel(
+        id=_ * 7, text=_, order=i) for i, _ in enumerate('rdxyz')]
+    d.state = GoalState.Done
+    d.parents.append(r)
+    c1.parents.extend([d, c2])
+    c2.parents.append(c1)
+    c3.parents.append(d)
+    database.add_all([r, d, c1, c2, c3])
+    database.commit()
+    assert [_.id for _ in routines.get_orphan_goals(database)] == [
+        'x' * 7, 'y' * 7]
+    c2.parents.append(r)
+    database.commit()
+    assert routines.get_orphan_goals(database) == []
+
+
+def test_get_goal_records(database):
+    a, b, c = [GoalModel(id=_ * 7, text=_, order=i) for i, _ in enumerate(
+        'abc')]
+    b.parents.append(a)
+    c.parents.append(a)
+    c.notes.append(Note(
+        id='n' * 7, id_datetime=datetime(2020, 1, 1), text='x'))
+    database.add_all([a, b, c])
+    database.commit()
+    goals = routines.get_goals(database, with_notes=True)
+    records = routines.get_goal_records(database, with_notes=True)
+    assert [_.id for _ in records] == [_.id for _ in goals]
+    assert routines.format_mission_text(
+        records, pytz.UTC) == routines.format_mission_text(goals, pytz.UTC)
+    assert routines.format_mission_text(
+        records[-1:], pytz.UTC) == routines.format_mission_text(
+            goals[-1:], pytz.UTC)
+
+
+def test_write_backups_concurrently(database, tmp_path):
+    goals = [GoalModel(id='%07d' % _, text=str(_), order=_) for _ in range(9)]
+    for index, goal in enumerate(goals):
+        if index:
+            goal.parents.append(goals[index // 2])
+        goal.notes.append(Note(id='n%06d' % index, text=str(index)))
+    database.add_all(goals)
+    database.commit()
+    snapshot = routines.get_goal_snapshot(database, with_notes=True)
+    paths_by_folder = {}
+    for folder_name in 'ab':
+        goals = routines.make_goal_records(snapshot)
+        goals_by_path = {tmp_path / folder_name / 'goals.md': goals}
+        for goal in goals:
+            goals_by_path[tmp_path / folder_name / (goal.id + '.md')] = [goal]
+        (tmp_path / folder_name).mkdir()
+        paths_by_folder[folder_name] = sorted(goals_by_path)
+        if folder_name == 'a':
+            routines.write_backups(goals_by_path, pytz.UTC)
+        else:
+            routines.write_backups_concurrently(
+                snapshot, goals_by_path, pytz.UTC, 2)
+    for path_a, path_b in zip(paths_by_folder['a'], paths_by_folder['b']):
+        assert path_a.read_text() == path_b.read_text()
+
+
+def test_save_unchanged_mission(database):
+    zone = pytz.timezone('US/Eastern')
+    a = GoalModel(id='a' * 7, text='a', order=1)
+    b = GoalModel(
+        id='b' * 7, text='b', order=2,
+        schedule_datetime=datetime(2020, 1, 1, 15))
+    b.parents.append(a)
+    b.notes.append(Note(
+        id='n' * 7, id_datetime=datetime(2020, 1, 1), text='x'))
+    database.add_all([a, b])
+    database.commit()
+    for goal_ids in None, ['b' * 7]:
+        goals = routines.get_goals(database, goal_ids, with_notes=True)
+        text = routines.format_mission_text(goals, zone)
+        assert routines.save_goals(database, routines.parse_mission_text(
+            database, text, zone)) == 0
+        database.close()
+
+
+def test_backup_database_incrementally(database, tmp_path):
+    goals = [GoalModel(id=_ * 7, text=_, order=i) for i, _ in enumerate(
+        'abcd', 1)]
+    a, b, c, d = goals
+    b.parents.append(a)
+    c.parents.append(b)
+    for goal in goals:
+        goal.notes.append(Note(
+            id=goal.id.upper(), id_datetime=datetime(2020, 1, 1),
+            text=goal.text))
+    database.add_all(goals)
+    database.commit()
+    target_folder = tmp_path / 'backups'
+
+    def backup():
+        routines.backup_database(
+            str(target_folder), database, pytz.UTC, incremental=True)
+        target_paths = sorted(target_folder.glob('*.md'))
+        names = {_.stem for _ in target_paths if _.read_text()}
+        for target_path in target_paths:
+            target_path.write_text('')
+        return names
+
+    assert backup() == {'goals', 'a' * 7, 'b' * 7, 'c' * 7, 'd' * 7}
+    assert backup() == set()
+    database.query(Note).get('C' * 7).text = 'x'
+    database.commit()
+    assert backup() == {'goals', 'a' * 7, 'b' * 7, 'c' * 7}
+    database.query(GoalModel).get('d' * 7).text = 'x'
+    database.commit()
+    assert backup() == {'goals', 'd' * 7}
@@ -0,0 +1,23 @@
+from configparser import ConfigParser
+from invisibleroads_macros.exceptions import InvisibleRoadsError
+from invisibleroads_scripts.settings import (
+    get_database_url, get_sqlite_pragma_by_name, SQLITE_PRAGMA_BY_NAME)
+from pytest import raises
+
+
+def test_get_sqlite_pragma_by_name():
+    c = ConfigParser()
+    assert get_sqlite_pragma_by_name(c) == SQLITE_PRAGMA_BY_NAME
+    assert SQLITE_PRAGMA_BY_NAME['journal_mode'] != 'wal'
+    c.read_string('[sqlite]\njournal_mode = wal\n')
+    assert get_sqlite_pragma_by_name(c)['journal_mode'] == 'wal'
+    c.read_string('[sqlite]\nsynchronous = off; DROP TABLE goal\n')
+    with raises(InvisibleRoadsError):
+        get_sqlite_pragma_by_name(c)
+
+
+def test_get_database_url(tmp_path):
+    c = ConfigParser()
+    c.read_string('[database]\npath = %s\n' % (tmp_path / 'goals.sqlite'))
+    assert 'immutable=1' not in get_database_url(c)
+    assert 'immutable=1' in get_database_url(c, immutable=True)